@@ -0,0 +1,129 @@
+import multiprocessing
+from collections import namedtuple
+from contextlib import nullcontext
+
+from HashTable import HashTable
+from Parser import load_parser
+from Profiler import Profiler
+from Scanner import Scanner
+
+# profile is the file's Profiler report when the batch is profiled
+FileResult = namedtuple('FileResult', ['path', 'accepted', 'lexically_correct', 'errors', 'symbols', 'symbol_ids',
+                                       'profile'], defaults=(None,))
+
+# Per-process state: set in the parent before forking, or by init_worker in spawned workers
+_scanner = None
+_parser = None
+_profile = None  # (memory, events) settings for a Profiler per file, None when not profiling
+
+
+def init_worker(token_file, grammar_file, cache_file, method, profile=None, optimize=False, bulk=False):
+    global _scanner, _parser, _profile
+    if _parser is None:
+        _parser = load_parser(grammar_file, cache_file, method, optimize=optimize)
+    if _scanner is None:
+        _scanner = Scanner(token_file, verbose=False, bulk=bulk)
+    _profile = profile
+
+
+def compile_file(path):
+    if _profile is None:
+        return check_file(path)
+    profiler = Profiler(*_profile)
+    _scanner.profiler = _parser.profiler = profiler
+    try:
+        result = check_file(path)
+    finally:
+        _scanner.profiler = _parser.profiler = None
+        profiler.stop()
+    profiler.count('files')
+    return result._replace(profile=profiler.report())
+
+
+def check_file(path):
+    _scanner.reset()
+    try:
+        tokens = _scanner.iter_tokens(path)
+        accepted = _parser.recognize(tokens)
+        for _ in tokens:  # Finish scanning after a syntax error so every lexical error is reported
+            pass
+    except OSError as error:
+        return FileResult(path, False, False, [f"cannot read {path}: {error.strerror}"], [], [])
+    except UnicodeDecodeError:
+        return FileResult(path, False, False, [f"cannot decode {path} as UTF-8"], [], [])
+    errors = list(_scanner.errors)
+    if not accepted:
+        errors.append(f"syntax error: {_parser.error}")
+    # Symbols are sent back in local id order; the parent assigns the global ids
+    return FileResult(path, bool(accepted) and _scanner.correct, _scanner.correct, errors,
+                      list(_scanner.symbol_table.symbols), [])
+
+
+def compile_request(path=None, source=None, tokens=False, tree=False):
+    # One request of the compile server (see Server): the file at path, or the given source text.
+    # Returns the result as a JSON-ready dict, with the tokens and the parse tree if asked for.
+    _scanner.reset()
+    try:
+        token_iterator = _scanner.iter_tokens(path) if source is None else _scanner.iter_text_tokens(source)
+        if tokens:
+            token_list = list(token_iterator)
+            token_iterator = iter(token_list)
+        if tree:
+            parser_output = _parser.parse_tokens(token_iterator)
+            accepted = bool(parser_output)
+        else:
+            accepted = _parser.recognize(token_iterator)
+        for _ in token_iterator:
+            pass
+    except OSError as error:
+        return {'accepted': False, 'lexically_correct': False, 'errors': [f"cannot read {path}: {error.strerror}"]}
+    except UnicodeDecodeError:
+        return {'accepted': False, 'lexically_correct': False, 'errors': [f"cannot decode {path} as UTF-8"]}
+    errors = list(_scanner.errors)
+    if not accepted:
+        errors.append(f"syntax error: {_parser.error}")
+    result = {'accepted': accepted and _scanner.correct, 'lexically_correct': _scanner.correct, 'errors': errors}
+    if tokens:
+        result['tokens'] = token_list
+    if tree and accepted:
+        result['tree'] = parser_output.get_tree()
+    return result
+
+
+def compile_batch(paths, grammar_file="grammar.in", token_file="token.in", processes=None, method='lalr',
+                  cache_file=None, chunksize=8, profiler=None, optimize=False, bulk=False):
+    # Scans and parses every file on a process pool. Results come back in input order, and every
+    # file's symbols are merged into one global symbol table in that same order, so the global ids
+    # do not depend on scheduling. symbol_ids[i] is the global id of the file's local symbol i.
+    # With a profiler, every file is profiled where it is compiled and the reports are added up in it.
+    global _scanner, _parser, _profile
+    paths = list(paths)
+    _parser = load_parser(grammar_file, cache_file, method, profiler, optimize)
+    _scanner = Scanner(token_file, verbose=False, profiler=profiler, bulk=bulk)
+    _parser.profiler = _scanner.profiler = None
+    _profile = None if profiler is None else (profiler.memory, profiler.events)
+
+    if processes == 1 or len(paths) <= 1:
+        results = [compile_file(path) for path in paths]
+    else:
+        # With fork the workers inherit the tables built above; otherwise each worker loads
+        # them once, from the cache file when one is given
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+        with context.Pool(processes, initializer=init_worker,
+                          initargs=(token_file, grammar_file, cache_file, method, _profile, optimize, bulk)) as pool:
+            results = list(pool.imap(compile_file, paths, chunksize))
+
+    symbol_table = HashTable()
+    merged = []
+    with profiler.phase('merge_symbols') if profiler is not None else nullcontext():
+        for result in results:
+            symbol_ids = [None if symbol is None else symbol_table.add(symbol) for symbol in result.symbols]
+            merged.append(result._replace(symbol_ids=symbol_ids))
+    if profiler is not None:
+        for result in results:
+            profiler.merge(result.profile)
+        profiler.count('global_symbols', len(symbol_table))
+        profiler.count('global_symbol_table_resizes', symbol_table.resizes)
+        profiler.count('global_symbol_table_collisions', symbol_table.collisions)
+    return merged, symbol_table
@@ -0,0 +1,332 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+from io import StringIO
+
+from BinaryFormat import BinaryPIF
+from BulkLexer import load_numpy
+from FiniteAutomation import FiniteAutomation
+from GLRParser import GLRParser
+from Grammar import FormalGrammar
+from Lexer import Lexer, automaton_files
+from ParseTables import CompactTables
+from Parser import LR0Parser, convert_tokens, read_scanner_output, read_symbol_table
+from ParserGenerator import generate, load_generated
+from Scanner import Scanner
+
+# Extra tokens a child that does not carry the rest of the program may get on top of its minimum
+SPREAD = 8
+# Names of terminals that stand for a class of lexemes rather than a fixed word
+IDENTIFIER = 'identifier'
+INTEGER = 'integer'
+BOOL = 'bool'
+
+LOWER = 'lower'
+HIGHER = 'higher'
+EQUAL = 'equal'  # Deterministic counts: any change is reported
+
+
+def minimum_lengths(productions):
+    # Fewest terminals each nonterminal can derive (fixpoint, like compute_nullable)
+    infinity = float('inf')
+    lengths = {lhs: infinity for lhs in productions}
+
+    def length(rhs):
+        return sum(lengths[symbol] if symbol in productions else 1 for symbol in rhs)
+
+    changed = True
+    while changed:
+        changed = False
+        for lhs, rhs_list in productions.items():
+            shortest = min(length(rhs) for rhs in rhs_list)
+            if shortest < lengths[lhs]:
+                lengths[lhs] = shortest
+                changed = True
+    return lengths
+
+
+def generate_terminals(productions, start, size, seed=0):
+    # Random derivation of about size terminals. Every nonterminal gets a budget; the child that
+    # carries a list (the lhs itself, else the last nonterminal) inherits whatever the others leave,
+    # so lists grow to the requested size while nested constructs stay small.
+    rng = random.Random(seed)
+    lengths = minimum_lengths(productions)
+
+    def length(rhs):
+        return sum(lengths[symbol] if symbol in productions else 1 for symbol in rhs)
+
+    output = []
+    stack = [(start, size)]
+    while stack:
+        symbol, budget = stack.pop()
+        if symbol not in productions:
+            output.append(symbol)
+            continue
+        options = productions[symbol]
+        feasible = [rhs for rhs in options if length(rhs) <= budget] or [min(options, key=length)]
+        if budget > 2 * SPREAD:
+            feasible = [rhs for rhs in feasible if symbol in rhs] or feasible
+        rhs = rng.choice(feasible)
+
+        nonterminals = [i for i, child in enumerate(rhs) if child in productions]
+        heir = rhs.index(symbol) if symbol in rhs else (nonterminals[-1] if nonterminals else -1)
+        budgets = [lengths[child] + rng.randint(0, SPREAD) if child in productions else 1 for child in rhs]
+        if heir >= 0:
+            rest = budget - sum(budgets) + budgets[heir]
+            budgets[heir] = max(lengths[rhs[heir]], min(rest, budget - 1))
+        for child, child_budget in zip(reversed(rhs), reversed(budgets)):
+            stack.append((child, child_budget))
+    return output
+
+
+def render(terminals, seed=0):
+    # Source text for a terminal sequence, with made-up identifiers and literals
+    rng = random.Random(seed)
+    words = []
+    for terminal in terminals:
+        if terminal == IDENTIFIER:
+            words.append(rng.choice('abcdefghijklmnopqrstuvwxyz') + str(rng.randrange(1000)))
+        elif terminal == INTEGER:
+            words.append(str(rng.randrange(100000)))
+        elif terminal == BOOL:
+            words.append(rng.choice(('true', 'false')))
+        else:
+            words.append(terminal)
+        words.append('\n' if terminal in (';', '{', '}') else ' ')
+    return ''.join(words)
+
+
+# synthetic_grammar levels giving about 100 and 1000 LR states
+SCALING_LEVELS = (30, 330)
+# Operands of the sums parsed with the ambiguous expression grammar
+GLR_OPERANDS = (50, 100)
+AMBIGUOUS_EXPRESSION = ({'E': [['E', '+', 'E'], ['E', '*', 'E'], ['(', 'E', ')'], ['a']]}, 'E', ['+', '*', '(', ')', 'a'])
+
+
+def synthetic_grammar(levels):
+    # A statement list over an expression grammar with one precedence level per operator; the
+    # number of LR states grows with the number of levels
+    productions = {
+        'program': [['statements']],
+        'statements': [['statements', 'statement'], ['statement']],
+        'statement': [['identifier', '=', 'e0', ';']],
+    }
+    for level in range(levels):
+        productions[f'e{level}'] = [[f'e{level}', f'op{level}', f'e{level + 1}'], [f'e{level + 1}']]
+    productions[f'e{levels}'] = [['(', 'e0', ')'], ['identifier'], ['integer']]
+    terminals = ['identifier', 'integer', '=', ';', '(', ')'] + [f'op{level}' for level in range(levels)]
+    return productions, 'program', terminals
+
+
+def best_time(function, repeat):
+    # Fastest of repeat runs, and the last result
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def peak_memory(function):
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run(size=20000, repeat=3, seed=0, levels=(10, 20, 40), method='lalr', grammar_file="grammar.in",
+        token_file="token.in"):
+    metrics = {}
+
+    def record(name, value, unit, better):
+        metrics[name] = {'value': value, 'unit': unit, 'better': better}
+        print(f"{name:<36}{value:>16.6g} {unit}")
+
+    automata = automaton_files(token_file)
+    seconds, _ = best_time(lambda: [FiniteAutomation(path) for path in automata], repeat)
+    record('fa_load', seconds, 's', LOWER)
+    seconds, lexer = best_time(lambda: Lexer.from_files(token_file), repeat)
+    record('lexer_build', seconds, 's', LOWER)
+    record('lexer_states', lexer.state_count, 'states', EQUAL)
+
+    grammar = FormalGrammar(grammar_file)
+    build = lambda: LR0Parser(grammar.productions, grammar.start, grammar.terminals, method=method)
+    seconds, parser = best_time(build, repeat)
+    record('table_build', seconds, 's', LOWER)
+    record('table_states', len(parser.states), 'states', EQUAL)
+    record('table_conflicts', len(parser.conflicts), 'conflicts', EQUAL)
+    optimized = grammar.optimized()
+    optimized_parser = LR0Parser(optimized.productions, optimized.start, optimized.terminals, method=method)
+    record('table_states_optimized', len(optimized_parser.states), 'states', EQUAL)
+    for level_count in levels:
+        productions, start, terminals = synthetic_grammar(level_count)
+        seconds, synthetic = best_time(lambda: LR0Parser(productions, start, terminals, method=method), repeat)
+        record(f'table_build_synthetic_{level_count}', seconds, 's', LOWER)
+        record(f'table_states_synthetic_{level_count}', len(synthetic.states), 'states', EQUAL)
+
+    # Table compression on about 100 and 1000 states: the time per table entry should stay about the
+    # same (a search that is quadratic in the table size shows up as a growing ratio)
+    per_entry = []
+    for level_count, name in ((SCALING_LEVELS[0], 'table_compress_synthetic_100'),
+                              (SCALING_LEVELS[1], 'table_compress_synthetic_1000')):
+        productions, start, terminals = synthetic_grammar(level_count)
+        synthetic = LR0Parser(productions, start, terminals, method=method)
+        seconds, _ = best_time(lambda: CompactTables(synthetic), repeat)
+        record(name, seconds, 's', LOWER)
+        per_entry.append(seconds / (len(synthetic.action) + len(synthetic.goto_table)))
+    record('table_compress_scaling', per_entry[1] / per_entry[0], 'x', LOWER)
+
+    terminals = generate_terminals(grammar.productions, grammar.start, size, seed)
+    text = render(terminals, seed)
+    with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as file:
+        file.write(text)
+    try:
+        def scan():
+            scanner = Scanner(token_file, verbose=False)
+            scanner.scan(file.name)
+            return scanner
+
+        seconds, scanner = best_time(scan, repeat)
+        record('scan_tokens', len(scanner.pif), 'tokens', EQUAL)
+        record('scan_throughput', len(scanner.pif) / seconds, 'tokens/s', HIGHER)
+        record('scan_peak_memory', peak_memory(scan), 'bytes', LOWER)
+        try:
+            load_numpy()
+        except ImportError:
+            print(f"{'bulk_scan_throughput':<36}{'skipped (no NumPy)':>16}")
+        else:
+            def bulk_scan():
+                bulk_scanner = Scanner(token_file, lexer=scanner.lexer, verbose=False, bulk=True)
+                bulk_scanner.scan(file.name)
+                return bulk_scanner
+
+            seconds, _ = best_time(bulk_scan, repeat)
+            record('bulk_scan_throughput', len(scanner.pif) / seconds, 'tokens/s', HIGHER)
+
+        # Reading a scanned file back for the parser, from the text files and from the binary format
+        scanner.write_to_files(file.name + '.st', file.name + '.pif')
+        scanner.write_binary(file.name + '.pifb')
+
+        def read_binary():
+            with BinaryPIF(file.name + '.pifb') as pif:
+                return list(pif.tokens())
+
+        seconds, _ = best_time(lambda: convert_tokens(read_scanner_output(file.name + '.pif'),
+                                                      read_symbol_table(file.name + '.st')), repeat)
+        record('pif_text_read_throughput', len(scanner.pif) / seconds, 'tokens/s', HIGHER)
+        seconds, _ = best_time(read_binary, repeat)
+        record('pif_binary_read_throughput', len(scanner.pif) / seconds, 'tokens/s', HIGHER)
+    finally:
+        for path in (file.name, file.name + '.st', file.name + '.pif', file.name + '.pifb'):
+            if os.path.exists(path):
+                os.remove(path)
+
+    # The parser is fed the generated terminals directly: grammar.in expects literal classes
+    # (integer, string, bool) that the scanner reports as plain constants
+    tokens = [(terminal, None) for terminal in terminals]
+    seconds, tree = best_time(lambda: parser.parse_tokens(tokens), repeat)
+    if not tree:
+        raise ValueError(f"The generated program was rejected: {parser.error}")
+    record('parse_tokens', len(tokens), 'tokens', EQUAL)
+    record('parse_throughput', len(tokens) / seconds, 'tokens/s', HIGHER)
+    seconds, _ = best_time(lambda: parser.recognize(tokens), repeat)
+    record('recognize_throughput', len(tokens) / seconds, 'tokens/s', HIGHER)
+    generated = load_generated(generate(parser))
+    seconds, _ = best_time(lambda: generated.recognize(tokens), repeat)
+    record('generated_recognize_throughput', len(tokens) / seconds, 'tokens/s', HIGHER)
+    glr_parser = GLRParser(parser)
+    seconds, _ = best_time(lambda: glr_parser.recognize(tokens), repeat)
+    record('glr_recognize_throughput', len(tokens) / seconds, 'tokens/s', HIGHER)
+
+    # Every way to group a sum of n operands: a forest built in cubic time takes 8 times as long for
+    # twice the operands, so the time over the cube of the size should stay about the same
+    with redirect_stdout(StringIO()):  # The conflicts are the point
+        ambiguous = GLRParser(LR0Parser(*AMBIGUOUS_EXPRESSION, method=method))
+    per_cube = []
+    for operands in GLR_OPERANDS:
+        sum_tokens = [('a', None)] + [('+', None), ('a', None)] * (operands - 1)
+        seconds, _ = best_time(lambda: ambiguous.parse_tokens(sum_tokens), repeat)
+        record(f'glr_ambiguous_parse_{operands}', seconds, 's', LOWER)
+        per_cube.append(seconds / operands ** 3)
+    record('glr_ambiguous_scaling', per_cube[1] / per_cube[0], 'x', LOWER)
+    record('parse_peak_memory', peak_memory(lambda: parser.parse_tokens(tokens)), 'bytes', LOWER)
+    record('recognize_peak_memory', peak_memory(lambda: parser.recognize(tokens)), 'bytes', LOWER)
+
+    return {
+        'settings': {'size': size, 'repeat': repeat, 'seed': seed, 'levels': list(levels), 'method': method,
+                     'grammar': grammar_file},
+        'python': platform.python_version(),
+        'metrics': metrics,
+    }
+
+
+def compare(baseline, results, threshold=0.1):
+    # Returns the names of the metrics that got worse than the baseline by more than threshold
+    # (a fraction), or changed at all for the ones that should never change
+    if baseline.get('settings') != results.get('settings'):
+        print("warning: the baseline was recorded with different settings")
+    regressions = []
+    for name, metric in results['metrics'].items():
+        if name not in baseline['metrics']:
+            continue
+        old = baseline['metrics'][name]['value']
+        new = metric['value']
+        change = (new - old) / old if old else (0.0 if new == old else float('inf'))
+        better = metric['better']
+        if better == LOWER:
+            regressed = change > threshold
+        elif better == HIGHER:
+            regressed = change < -threshold
+        else:
+            regressed = new != old
+        if regressed:
+            regressions.append(name)
+        print(f"{name:<36}{old:>14.6g}{new:>14.6g}{change:>+10.1%}{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def main(arguments=None):
+    argument_parser = argparse.ArgumentParser(description="Benchmarks the scanner and the parser.")
+    argument_parser.add_argument('--size', type=int, default=20000, help="terminals in the generated program")
+    argument_parser.add_argument('--repeat', type=int, default=3, help="runs per timing, the fastest is kept")
+    argument_parser.add_argument('--seed', type=int, default=0)
+    argument_parser.add_argument('--levels', type=int, nargs='*', default=[10, 20, 40],
+                                 help="sizes of the synthetic grammars")
+    argument_parser.add_argument('--method', choices=('lr0', 'slr', 'lalr'), default='lalr')
+    argument_parser.add_argument('--grammar', default="grammar.in")
+    argument_parser.add_argument('--tokens', default="token.in")
+    argument_parser.add_argument('--save', metavar='FILE', help="write the results as a JSON baseline")
+    argument_parser.add_argument('--compare', metavar='FILE', help="compare against a JSON baseline")
+    argument_parser.add_argument('--threshold', type=float, default=0.1,
+                                 help="allowed slowdown as a fraction (default 0.1)")
+    options = argument_parser.parse_args(arguments)
+
+    results = run(options.size, options.repeat, options.seed, options.levels, options.method, options.grammar,
+                  options.tokens)
+    if options.save:
+        with open(options.save, 'w') as file:
+            json.dump(results, file, indent=2)
+    if options.compare:
+        with open(options.compare) as file:
+            baseline = json.load(file)
+        print()
+        regressions = compare(baseline, results, options.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
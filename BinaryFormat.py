@@ -0,0 +1,204 @@
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+from Files import atomic_write
+from Lexer import CONSTANT, IDENTIFIER
+
+# A scanned file in one binary file, all integers little-endian:
+#   header    magic, version, then the number of token kinds, PIF records and symbols
+#   kinds     (kind count + 1) uint32 offsets into the kind pool, then the pool (UTF-8 token types)
+#   records   one (kind id, symbol id) int32 pair per PIF entry; the symbol id is -1 for reserved tokens
+#   symbols   (symbol count + 1) uint32 offsets into the string pool, then the pool (UTF-8 symbols)
+# Sections start on 4 byte boundaries. A deleted symbol is stored as an empty string: symbols never are.
+MAGIC = b'TPIF'
+VERSION = 1
+HEADER = struct.Struct('<4sHHIII')
+CORRUPT = "corrupt binary PIF file"
+
+
+def pad(size):
+    return -size % 4
+
+
+def little_endian(values):
+    if sys.byteorder != 'little':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values
+
+
+def string_pool(strings):
+    # (offsets, pool) with string i at pool[offsets[i]:offsets[i + 1]]
+    encoded = [b'' if string is None else string.encode('utf-8') for string in strings]
+    offsets = array('I', [0])
+    for data in encoded:
+        offsets.append(offsets[-1] + len(data))
+    return offsets, b''.join(encoded)
+
+
+def write_binary(path, pif, symbols):
+    # pif: (token type, symbol id) pairs as in Scanner.pif; symbols: symbol text by id (None if deleted).
+    # Written with atomic_write, so a reader never maps half a file.
+    kind_ids = {}
+    records = array('i')
+    for token_type, symbol_id in pif:
+        kind_id = kind_ids.get(token_type)
+        if kind_id is None:
+            kind_id = kind_ids[token_type] = len(kind_ids)
+        records.append(kind_id)
+        records.append(symbol_id)
+    kind_offsets, kind_pool = string_pool(kind_ids)
+    symbol_offsets, symbol_pool = string_pool(symbols)
+    sections = [
+        HEADER.pack(MAGIC, VERSION, 0, len(kind_ids), len(pif), len(symbols)),
+        little_endian(kind_offsets).tobytes(), kind_pool, b'\0' * pad(len(kind_pool)),
+        little_endian(records).tobytes(),
+        little_endian(symbol_offsets).tobytes(), symbol_pool,
+    ]
+    return atomic_write(path, lambda file: file.writelines(sections))
+
+
+class BinaryPIF:
+    # A file written by write_binary, memory-mapped: records and symbols are read straight from the
+    # mapping through memoryviews, so opening it costs the same whatever its size. Close it (or use
+    # it as a context manager) before the file is replaced.
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as file:
+            size = os.fstat(file.fileno()).st_size
+            if size < HEADER.size:
+                raise ValueError("not a binary PIF file")
+            self.mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.views = []
+        try:
+            self.read_sections(size)
+        except ValueError:
+            self.close()
+            raise
+
+    def read_sections(self, size):
+        magic, version, _, kind_count, record_count, symbol_count = HEADER.unpack_from(self.mapped)
+        if magic != MAGIC:
+            raise ValueError("not a binary PIF file")
+        if version != VERSION:
+            raise ValueError(f"binary PIF format version {version}, expected {VERSION}")
+        position = HEADER.size
+        kind_offsets, position = self.integers(position, kind_count + 1, 'I', size)
+        kind_pool = self.mapped[position:position + kind_offsets[-1]]
+        if any(kind_offsets[i] > kind_offsets[i + 1] for i in range(kind_count)):
+            raise ValueError(CORRUPT)
+        try:
+            self.kinds = [kind_pool[kind_offsets[i]:kind_offsets[i + 1]].decode('utf-8') for i in range(kind_count)]
+        except UnicodeDecodeError:
+            raise ValueError(CORRUPT) from None
+        position += kind_offsets[-1]
+        position += pad(position)
+        self.records, position = self.integers(position, 2 * record_count, 'i', size)
+        self.offsets, position = self.integers(position, symbol_count + 1, 'I', size)
+        if position + self.offsets[-1] > size:
+            raise ValueError("truncated binary PIF file")
+        self.pool = self.view(position, position + self.offsets[-1])
+        self.record_count = record_count
+        self.symbol_count = symbol_count
+
+    def view(self, start, end):
+        view = memoryview(self.mapped)[start:end]
+        self.views.append(view)
+        return view
+
+    def integers(self, position, count, typecode, size):
+        # count integers at position, as a memoryview of the mapping (a copy on big-endian machines)
+        end = position + 4 * count
+        if end > size:
+            raise ValueError("truncated binary PIF file")
+        if sys.byteorder != 'little':
+            values = array(typecode, self.mapped[position:end])
+            values.byteswap()
+            return values, end
+        view = self.view(position, end).cast(typecode)
+        self.views.append(view)
+        return view, end
+
+    def __len__(self):
+        return self.record_count
+
+    def __getitem__(self, index):
+        if not -self.record_count <= index < self.record_count:
+            raise IndexError("PIF record out of range")
+        index %= self.record_count
+        return self.kind(self.records[2 * index]), self.records[2 * index + 1]
+
+    def __iter__(self):
+        # (token type, symbol id) pairs, as in Scanner.pif
+        kind = self.kind
+        records = self.records
+        for i in range(0, 2 * self.record_count, 2):
+            yield kind(records[i]), records[i + 1]
+
+    def kind(self, kind_id):
+        # Ids are only checked when they are read, so opening a file does not go through all of it
+        if not 0 <= kind_id < len(self.kinds):
+            raise ValueError(CORRUPT)
+        return self.kinds[kind_id]
+
+    def symbol(self, symbol_id):
+        if not 0 <= symbol_id < self.symbol_count:
+            raise ValueError(CORRUPT)
+        start = self.offsets[symbol_id]
+        end = self.offsets[symbol_id + 1]
+        if end < start or end > len(self.pool):
+            raise ValueError(CORRUPT)
+        if end == start:
+            return None
+        try:
+            return str(self.pool[start:end], 'utf-8')
+        except UnicodeDecodeError:
+            raise ValueError(CORRUPT) from None
+
+    def symbols(self):
+        return [self.symbol(symbol_id) for symbol_id in range(self.symbol_count)]
+
+    def tokens(self):
+        # (token type, value) pairs as Scanner.iter_tokens yields them, ready for the parser. Every
+        # symbol is decoded once, and every reserved token is the same tuple each time.
+        kinds = self.kinds
+        reserved = {kind_id: (kind, None) for kind_id, kind in enumerate(kinds)}
+        symbol_kinds = {kind_id for kind_id, kind in enumerate(kinds) if kind == IDENTIFIER or kind == CONSTANT}
+        symbols = self.symbols()
+        symbol_count = self.symbol_count
+        for kind_id, symbol_id in zip(self.records[0::2], self.records[1::2]):
+            if kind_id in symbol_kinds:
+                if not 0 <= symbol_id < symbol_count:
+                    raise ValueError(CORRUPT)
+                yield kinds[kind_id], symbols[symbol_id]
+            else:
+                token = reserved.get(kind_id)
+                if token is None:
+                    raise ValueError(CORRUPT)
+                yield token
+
+    def export_text(self, symbol_file, pif_file):
+        # The text format of Scanner.write_to_files
+        with open(symbol_file, 'w') as file:
+            for symbol in self.symbols():
+                file.write(('-' if symbol is None else symbol) + '\n')
+        with open(pif_file, 'w') as file:
+            for pair in self:
+                file.write(str(pair) + '\n')
+
+    def close(self):
+        # The mapping can only be closed once no memoryview refers to it
+        for view in reversed(self.views):
+            view.release()
+        self.views = []
+        self.records = self.offsets = self.pool = None
+        self.mapped.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
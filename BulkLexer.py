@@ -0,0 +1,234 @@
+from Lexer import CONSTANT, ERROR, IDENTIFIER, RESERVED, SEPARATORS, SKIP, WHITESPACE
+
+QUOTE = ord('"')
+SLASH = ord('/')
+NEWLINE = ord('\n')
+# Segments up to this long are matched by the vectorized automaton, one NumPy step per character
+# position for all of them at once; longer ones (and errors) are lexed by the Lexer itself
+STEP_LIMIT = 48
+# Distinct pieces the Lexer scanned, kept; the cache is emptied when it is full, so inputs with a
+# lot of them do not grow it without bound
+CACHE_LIMIT = 1 << 16
+
+
+def load_numpy():
+    # NumPy is only needed by the bulk lexer, so it is imported when one is made
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError("The bulk lexer needs NumPy (pip install numpy)") from None
+    return numpy
+
+
+class BulkLexer:
+    # Lexer.scan_chunk without a Python step per character. Apart from string literals and comments,
+    # no token contains whitespace or a quote, and none mixes separator characters (operators and
+    # punctuation) with others (checked against the lexer's components). So once the literals and
+    # comments are found (from the quotes, the '//' and the newlines, line by line), every other
+    # token lies inside a segment of only separators or only other characters, and the Lexer starts
+    # a new token at every segment boundary. Character lookup tables find the segments, and the
+    # Lexer's own automaton runs on all of them at once: a segment it accepts whole is one token
+    # with the label of the state it ends in, exactly as the Lexer would report it. Only segments
+    # that hold several tokens or errors are handed to the Lexer, once per distinct segment.
+    def __init__(self, lexer):
+        numpy = self.numpy = load_numpy()
+        self.lexer = lexer
+        self.check_components()
+        # By character code; anything above 255 is neither a space nor a separator
+        self.space = numpy.zeros(256, dtype=bool)
+        self.space[[ord(char) for char in WHITESPACE]] = True
+        self.separator = numpy.zeros(256, dtype=bool)
+        self.separator[[ord(char) for char in SEPARATORS]] = True
+        self.classes = numpy.array([ord(chr(code).translate(lexer.translation)) for code in range(256)],
+                                   dtype=numpy.intp)
+        self.table = numpy.array(lexer.table, dtype=numpy.intp)
+        # Label index of every state (-1 for none, and for the dead state -1 at the end)
+        self.labels = [label for label in dict.fromkeys(lexer.accept) if label is not None and label != SKIP]
+        self.labels += [label for label in (CONSTANT, ERROR) if label not in self.labels]
+        self.accept = numpy.array([self.labels.index(label) if label in self.labels else -1
+                                   for label in lexer.accept] + [-1], dtype=numpy.intp)
+        self.cache = {}
+
+    def check_components(self):
+        separators = set(SEPARATORS)
+        for component in self.lexer.components:
+            if component.label == RESERVED:
+                for word in component.final:
+                    mixed = not separators.isdisjoint(word) and not separators.issuperset(word)
+                    if (any(char in WHITESPACE or char == '"' for char in word) or '/' in word[1:]
+                            or word.startswith('//') or mixed):
+                        raise ValueError(f"The bulk lexer cannot split the reserved word {word!r}")
+            elif component.label in (IDENTIFIER, CONSTANT) and not component.defaults:  # Not string literals
+                chars = component.chars()
+                if chars & set(WHITESPACE + '"' + SEPARATORS):
+                    raise ValueError(f"The bulk lexer cannot split {component.label}s with {sorted(chars)}")
+
+    def scan_chunk(self, text, position=0, final=True):
+        # Same tokens and return value as Lexer.scan_chunk. Unless final, scanning stops after the
+        # last whitespace that is not inside a literal or a comment: no token goes across it, while
+        # any after it could still grow. It need not be the same place the Lexer stops at.
+        tokens, consumed = self.scan_range(text[position:], position, final)
+        return tokens, position + consumed
+
+    def scan_range(self, part, offset, final=True):
+        numpy = self.numpy
+        if part.isascii():
+            codes = numpy.frombuffer(part.encode('ascii'), dtype=numpy.uint8)
+            space = self.space[codes]
+            separator = self.separator[codes]
+            classes = self.classes[codes]
+        else:
+            codes = numpy.frombuffer(part.encode('utf-32-le'), dtype='<u4')
+            low = numpy.minimum(codes, 255)  # 255 is neither a space nor a separator
+            space = self.space[low]
+            separator = self.separator[low]
+            classes = numpy.frombuffer(part.translate(self.lexer.translation).encode('latin-1'), dtype=numpy.uint8)
+        length = len(codes)
+        if not length:
+            return [], 0
+
+        # String literals and comments never go past the end of a line, so every line can be worked
+        # out on its own. On a line, quotes pair up left to right into literals; a last quote left
+        # without a partner is an error token of its own (the rest of the line is lexed as usual).
+        # The comment starts at the first '//' that is not inside a literal, i.e. that has an even
+        # number of quotes before it on the line, or no quote after it to close the literal.
+        newlines = numpy.flatnonzero(codes == NEWLINE)
+        line_ends = numpy.append(newlines, length)
+        line_starts = numpy.concatenate(([0], newlines + 1))
+        quotes = numpy.flatnonzero(codes == QUOTE)
+        quote_lines = numpy.searchsorted(newlines, quotes)
+        slash = codes == SLASH
+        comments = numpy.flatnonzero(slash[:-1] & slash[1:])
+        comment_lines = numpy.searchsorted(newlines, comments)
+        before = numpy.searchsorted(quotes, comments)
+        quotes_before = before - numpy.searchsorted(quotes, line_starts[comment_lines])
+        quote_after = numpy.append(quotes, length)[before] < line_ends[comment_lines]
+        comments = comments[(quotes_before % 2 == 0) | ~quote_after]
+        comment_lines = numpy.searchsorted(newlines, comments)
+        first = numpy.ones(len(comments), dtype=bool)
+        first[1:] = comment_lines[1:] != comment_lines[:-1]
+        comments = comments[first]
+        comment_ends = line_ends[comment_lines[first]]
+        line_comments = numpy.full(len(line_ends), length)  # Where each line's comment starts
+        line_comments[comment_lines[first]] = comments
+        kept = quotes < line_comments[quote_lines]
+        quotes = quotes[kept]
+        quote_lines = quote_lines[kept]
+        line_first = numpy.ones(len(quotes), dtype=bool)
+        line_first[1:] = quote_lines[1:] != quote_lines[:-1]
+        indexes = numpy.arange(len(quotes))
+        rank = indexes - numpy.maximum.accumulate(numpy.where(line_first, indexes, 0))
+        line_last = numpy.append(line_first[1:], True)
+        opening = rank % 2 == 0
+        lone = opening & line_last
+        opening &= ~line_last
+        string_starts = quotes[opening]
+        string_ends = quotes[numpy.flatnonzero(opening) + 1] + 1
+        lone_starts = quotes[lone]
+
+        delta = numpy.zeros(length + 1, dtype=numpy.int8)
+        for span_starts, span_ends in ((string_starts, string_ends), (lone_starts, lone_starts + 1),
+                                       (comments, comment_ends)):
+            delta[span_starts] += 1
+            delta[span_ends] -= 1
+        outside = numpy.cumsum(delta[:-1], dtype=numpy.int8) == 0
+
+        # Unless final, the text ends at the last whitespace outside the literals and comments, and
+        # before a quote or comment on the last line that the next chunk could still change
+        end = length
+        if not final:
+            last_line = line_starts[-1]
+            limit = length
+            if len(lone_starts) and lone_starts[-1] >= last_line:
+                limit = lone_starts[-1]
+            if len(comments) and comments[-1] >= last_line:
+                limit = min(limit, comments[-1])
+            breaks = numpy.flatnonzero(space[last_line:limit] & outside[last_line:limit])
+            end = int(last_line + breaks[-1] + 1) if len(breaks) else int(last_line)
+
+        # Whatever is neither whitespace nor inside one of those is made of segments of separators
+        # (kind 2) and of other characters (kind 1)
+        kind = (~space & outside).view(numpy.int8) * (1 + separator.view(numpy.int8))
+        bounds = numpy.flatnonzero(kind[1:] != kind[:-1]) + 1
+        segment_starts = numpy.concatenate(([0], bounds))
+        segment_ends = numpy.append(bounds, length)
+        plain = kind[segment_starts] != 0
+        segment_starts = segment_starts[plain]
+        segment_ends = segment_ends[plain]
+        token_starts, token_ends, token_labels = self.match_tokens(classes, segment_starts, segment_ends)
+
+        # Tokens, literals and lone quotes in text order, up to the end of what is scanned
+        starts = numpy.concatenate((token_starts, string_starts, lone_starts))
+        ends = numpy.concatenate((token_ends, string_ends, lone_starts + 1))
+        labels = numpy.concatenate((token_labels, numpy.full(len(string_starts), self.labels.index(CONSTANT)),
+                                    numpy.full(len(lone_starts), self.labels.index(ERROR))))
+        order = numpy.argsort(starts, kind='stable')
+        starts = starts[order]
+        count = numpy.searchsorted(starts, end) if end < length else len(starts)
+        starts = starts[:count]
+        ends = ends[order][:count]
+        labels = labels[order][:count]
+        return self.build_tokens(part, offset, starts, ends, labels), end
+
+    def match_tokens(self, classes, starts, ends):
+        # Longest match in every segment at once: the Lexer's automaton takes a character position of
+        # every segment per step and a token of every segment per round. Returns the tokens as starts,
+        # ends and label indexes; what the automaton does not match (an error and whatever follows it
+        # in the segment, or a segment too long to step through) comes back as one piece with label
+        # -1, for the Lexer to scan.
+        numpy = self.numpy
+        table = self.table
+        accept = self.accept
+        width = self.lexer.class_count
+        long = ends - starts > STEP_LIMIT
+        found = [(starts[long], ends[long], numpy.full(numpy.count_nonzero(long), -1, dtype=numpy.intp))]
+        positions = starts[~long]
+        limits = ends[~long]
+        while len(positions):
+            token_ends = positions.copy()
+            token_labels = numpy.full(len(positions), -1, dtype=numpy.intp)
+            index = numpy.arange(len(positions))
+            cursors = positions.copy()
+            states = numpy.full(len(positions), self.lexer.start, dtype=numpy.intp)
+            while len(index):
+                states = table[states * width + classes[cursors]]
+                cursors += 1
+                labels = accept[states]  # The dead state (-1) has no label either
+                accepted = labels >= 0
+                token_ends[index[accepted]] = cursors[accepted]
+                token_labels[index[accepted]] = labels[accepted]
+                going = (states >= 0) & (cursors < limits[index])
+                index = index[going]
+                cursors = cursors[going]
+                states = states[going]
+            matched = token_labels >= 0
+            found.append((positions[matched], token_ends[matched], token_labels[matched]))
+            found.append((positions[~matched], limits[~matched], token_labels[~matched]))
+            going = matched & (token_ends < limits)
+            positions = token_ends[going]
+            limits = limits[going]
+        return [numpy.concatenate(arrays) for arrays in zip(*found)]
+
+    def build_tokens(self, part, offset, starts, ends, labels):
+        # The pieces left to the Lexer (label -1) are scanned and spliced in, once per distinct piece
+        names = self.labels
+        tokens = [(names[label], part[start:end], start + offset)
+                  for label, start, end in zip(labels.tolist(), starts.tolist(), ends.tolist())]
+        pieces = self.numpy.flatnonzero(labels < 0).tolist()
+        if not pieces:
+            return tokens
+        spliced = []
+        previous = 0
+        cache = self.cache
+        for i in pieces:
+            spliced += tokens[previous:i]
+            previous = i + 1
+            _, piece, piece_offset = tokens[i]
+            found = cache.get(piece)
+            if found is None:
+                if len(cache) >= CACHE_LIMIT:
+                    cache.clear()
+                found = cache[piece] = self.lexer.scan_chunk(piece, 0, True)[0]
+            spliced += [(label, lexeme, piece_offset + relative) for label, lexeme, relative in found]
+        spliced += tokens[previous:]
+        return spliced
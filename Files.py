@@ -0,0 +1,17 @@
+import os
+
+
+def atomic_write(path, write, binary=True):
+    # Calls write(file) on a temporary file next to path, then renames it over path, so a crash never
+    # leaves a half-written file behind and a reader sees either the old file or the whole new one.
+    # Returns False (with the temporary file removed) if anything could not be written.
+    tmp_file = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_file, 'wb' if binary else 'w') as file:
+            write(file)
+        os.replace(tmp_file, path)
+    except OSError:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        return False
+    return True
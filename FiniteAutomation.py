@@ -1,3 +1,67 @@
+from array import array
+
+
+def hopcroft_minimize(edges, labels):
+    # edges[state][class] is the target state or -1 (dead); states start out grouped by label.
+    # Returns (block of every state, block of the implicit dead state).
+    state_count = len(edges)
+    class_count = len(edges[0]) if edges else 0
+    dead = state_count
+    inverse = [[[] for _ in range(state_count + 1)] for _ in range(class_count)]
+    for state, row in enumerate(edges):
+        for class_id, target in enumerate(row):
+            inverse[class_id][dead if target < 0 else target].append(state)
+    for class_id in range(class_count):
+        inverse[class_id][dead].append(dead)
+
+    # The dead state is unlabelled, so states that can never accept end up merged with it
+    initial = {}
+    for state in range(state_count):
+        initial.setdefault(labels[state], []).append(state)
+    initial.setdefault(None, []).append(dead)
+    blocks = []
+    block_of = [0] * (state_count + 1)
+    for members in initial.values():
+        for state in members:
+            block_of[state] = len(blocks)
+        blocks.append(set(members))
+
+    largest = max(range(len(blocks)), key=lambda block: len(blocks[block]))
+    waiting = [block for block in range(len(blocks)) if block != largest]
+    in_waiting = set(waiting)
+    while waiting:
+        splitter = waiting.pop()
+        in_waiting.discard(splitter)
+        members = list(blocks[splitter])
+        for class_id in range(class_count):
+            predecessors = inverse[class_id]
+            touched = {}
+            for target in members:
+                for state in predecessors[target]:
+                    touched.setdefault(block_of[state], set()).add(state)
+            for block, inside in touched.items():
+                if len(inside) == len(blocks[block]):
+                    continue
+                new_block = len(blocks)
+                blocks[block] -= inside
+                blocks.append(inside)
+                for state in inside:
+                    block_of[state] = new_block
+                if block in in_waiting or len(inside) <= len(blocks[block]):
+                    waiting.append(new_block)
+                    in_waiting.add(new_block)
+                else:
+                    waiting.append(block)
+                    in_waiting.add(block)
+    return block_of[:state_count], block_of[dead]
+
+
+class CharClasses(dict):
+    # str.translate table mapping characters to class ids; unknown characters map to class 0
+    def __missing__(self, key):
+        return '\x00'
+
+
 class FiniteAutomation:
     def __init__(self, filename):
         self.filename = filename
@@ -7,16 +71,86 @@ class FiniteAutomation:
         self.final = []
         self.transitions = {}
         self.read_from_file()
+        self.compile()
+
+    def compile(self):
+        # Integer state ids and a dense transition array over character classes, minimized.
+        # Class 0 holds every character outside the alphabet and always leads to rejection.
+        states = list(dict.fromkeys(self.states + [self.start] + self.final +
+                                    [state for state, _ in self.transitions] + list(self.transitions.values())))
+        state_ids = {state: i for i, state in enumerate(states)}
+        class_ids = {}
+        self.translation = CharClasses()
+        for char in self.alphabet:
+            if len(char) != 1:
+                continue
+            column = tuple(state_ids[self.transitions[(state, char)]] if (state, char) in self.transitions else -1
+                           for state in states)
+            class_id = class_ids.setdefault(column, len(class_ids) + 1)
+            self.translation[ord(char)] = chr(class_id)
+        self.class_count = len(class_ids) + 1
+        if self.class_count > 256:
+            raise ValueError(f"Too many character classes in {self.filename}")
+        columns = sorted(class_ids, key=class_ids.get)
+        edges = [[-1] + [column[state] for column in columns] for state in range(len(states))]
+        final = set(self.final)
+        block_of, dead = hopcroft_minimize(edges, [True if state in final else None for state in states])
+
+        # Renumber the blocks densely with the start state first; the dead block becomes -1
+        numbering = {dead: -1}
+        for block in [block_of[state_ids[self.start]]] + block_of:
+            if block not in numbering:
+                numbering[block] = len(numbering) - 1
+        self.state_count = len(numbering) - 1
+        self.start_id = numbering[block_of[state_ids[self.start]]]
+        self.table = array('i', [-1] * (self.state_count * self.class_count))
+        self.accepting = bytearray(max(self.state_count, 1))
+        for state, row in enumerate(edges):
+            new_state = numbering[block_of[state]]
+            if new_state < 0:
+                continue
+            self.accepting[new_state] = states[state] in final
+            for class_id, target in enumerate(row):
+                if target >= 0:
+                    self.table[new_state * self.class_count + class_id] = numbering[block_of[target]]
 
     def is_accept(self, string):
-        state = self.start
-        for char in string:
-            if char not in self.alphabet:
+        state = self.start_id
+        if state < 0:
+            return False
+        table = self.table
+        width = self.class_count
+        for code in string.translate(self.translation).encode('latin-1'):
+            state = table[state * width + code]
+            if state < 0:
                 return False
-            if (state, char) not in self.transitions.keys():
-                return False
-            state = self.transitions[(state, char)]
-        return state in self.final
+        return self.accepting[state] == 1
+
+    def accept_many(self, strings):
+        return [self.is_accept(string) for string in strings]
+
+    def longest_match(self, buffer, offset=0, codes=None):
+        # End of the longest accepted prefix of buffer[offset:], or -1 if no prefix is accepted
+        if codes is None:
+            codes = buffer.translate(self.translation).encode('latin-1')
+        table = self.table
+        width = self.class_count
+        accepting = self.accepting
+        state = self.start_id
+        end = offset if state >= 0 and accepting[state] else -1
+        i = offset
+        length = len(codes)
+        while state >= 0 and i < length:
+            state = table[state * width + codes[i]]
+            i += 1
+            if state >= 0 and accepting[state]:
+                end = i
+        return end
+
+    def longest_matches(self, buffer, offsets):
+        # Same as longest_match for many offsets, translating the buffer only once
+        codes = buffer.translate(self.translation).encode('latin-1')
+        return [self.longest_match(buffer, offset, codes) for offset in offsets]
 
     def __str__(self):
         return "states: " + str(self.states) + "\n" \
@@ -38,6 +172,3 @@ class FiniteAutomation:
                 value = transition_str.split(" ")[2].strip()
                 self.transitions[key] = value
 
-
-fa = FiniteAutomation("fa_numeric-const.in")
-print(fa.is_accept("-0"))
@@ -0,0 +1,424 @@
+import gc
+from contextlib import contextmanager
+
+from GrammarAnalysis import END_MARKER
+from ParseTables import ACCEPT
+
+
+@contextmanager
+def paused_gc():
+    # A parse allocates the stack and forest nodes by the million and frees none of them until it
+    # ends, so the cycle collector would only go through all of them again and again as they pile
+    # up, and the time per node would grow with the size of the forest. Only a cyclic grammar makes
+    # cycles, and those are collected once the collector runs again.
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+class StackNode:
+    # A node of the graph-structured stack: one LR state at one input position. edges maps every
+    # node directly below it to the forest node for the symbol between the two; flat lists the ones
+    # on the same level (below it by an empty derivation).
+    __slots__ = ('state', 'level', 'edges', 'flat')
+
+    def __init__(self, state, level):
+        self.state = state
+        self.level = level
+        self.edges = {}
+        self.flat = []
+
+    def add_edge(self, below, label):
+        self.edges[below] = label
+        if below.level == self.level:
+            self.flat.append(below)
+
+
+class ForestNode:
+    # A symbol over the tokens [start, end). Tokens are leaves with a value; every other node lists
+    # its alternatives as (production, children) families, so an ambiguity is a node with several
+    # families and a subtree shared by several parses is stored once (a packed shared parse forest).
+    # Nodes with symbol None are intermediate: they stand for the leading children of the families
+    # that hold them, every way those can be derived (their own families have production None).
+    # Splitting long right-hand sides this way keeps the forest, and the time to build it, cubic.
+    __slots__ = ('symbol', 'start', 'end', 'value', 'families')
+
+    def __init__(self, symbol, start, end, value=None, families=None):
+        self.symbol = symbol
+        self.start = start
+        self.end = end
+        self.value = value
+        self.families = families  # None for leaves
+
+    def is_ambiguous(self):
+        return self.families is not None and len(self.families) > 1
+
+    def __repr__(self):
+        return f"ForestNode({self.symbol!r}, {self.start}, {self.end})"
+
+
+class GLRParser:
+    # Generalized LR over the tables of an LR0Parser: every conflict recorded while the tables were
+    # built stays in, and the parser follows all of the actions at once. Stacks that reach the same
+    # state at the same token are merged into one node of a graph-structured stack, and every
+    # symbol over the same tokens gets one forest node, so the work stays polynomial however
+    # ambiguous the grammar. While there is a single stack and a single action the parser takes a
+    # plain LR step without any of the bookkeeping.
+    def __init__(self, parser):
+        self.parser = parser
+        self.productions = parser.productions
+        self.lengths = [len(rhs) for _, rhs in parser.productions]
+        self.actions = [{} for _ in parser.states]  # Action codes (as in ParseTables) per state and terminal
+        encode = parser.tables.encode
+        for (state, symbol), value in parser.action.items():
+            self.actions[state][symbol] = (encode(parser, value),)
+        for (state, symbol), _, value in parser.conflicts:
+            codes = self.actions[state][symbol]
+            code = encode(parser, value)
+            if code not in codes:
+                self.actions[state][symbol] = codes + (code,)
+        self.gotos = [{} for _ in parser.states]
+        for (state, symbol), target in parser.goto_table.items():
+            self.gotos[state][symbol] = target
+        self.error = None
+        self.stack_nodes = 0  # Graph-structured stack nodes created by the last parse
+
+    def recognize(self, tokens):
+        with paused_gc():
+            return self.run_parser(tokens, build_forest=False)
+
+    def parse_tokens(self, tokens):
+        # Returns the forest node of the start symbol, or False after setting self.error
+        with paused_gc():
+            return self.run_parser(tokens, build_forest=True)
+
+    def run_parser(self, tokens, build_forest=True):
+        actions = self.actions
+        gotos = self.gotos
+        lengths = self.lengths
+        productions = self.productions
+        self.error = None
+
+        # While there is a single stack, its top part is kept in plain lists above the graph node base
+        # and runs like an LR stack: the states, the level each one was entered at and, when
+        # building the forest, the forest node of the symbol in front of each
+        base = StackNode(0, 0)  # Start state is always 0
+        states = []
+        levels = []
+        labels = []
+        frontier = None  # The nodes of the current level by state, or None while in the lists
+        reduced = set()  # (depth or -1 if empty, goto state) of the plain reductions on this level
+        symbols = {}  # Forest nodes ending at this level, by (symbol, start)
+        lower = LowerPaths(build_forest)
+        created = 1
+        level = 0
+        token_iterator = iter(tokens)
+        end_token = (END_MARKER, None)
+        token = next(token_iterator, end_token)
+
+        while True:
+            token_type = token[0]
+            if frontier is None:
+                codes = actions[states[-1] if states else base.state].get(token_type)
+                if codes is not None and len(codes) == 1:
+                    code = codes[0]
+                    if code > 0:  # Shift
+                        level += 1
+                        states.append(code - 1)
+                        levels.append(level)
+                        if build_forest:
+                            labels.append(ForestNode(token_type, level - 1, level, token[1]))
+                        if reduced:
+                            reduced = set()
+                            symbols = {}
+                        token = next(token_iterator, end_token)
+                        continue
+                    production = -code - 1
+                    depth = len(states) - lengths[production]
+                    if code < ACCEPT and depth >= 0:  # Reduce within the lists
+                        lhs = productions[production][0]
+                        target = gotos[states[depth - 1] if depth else base.state][lhs]
+                        start = levels[depth - 1] if depth else base.level
+                        # Coming back to the same state over the same stack only happens in a cycle of
+                        # reductions (a cyclic grammar), which the general step handles. Empty ones can
+                        # also grow the stack, so for them the state alone counts.
+                        key = (depth if start < level else -1, target)
+                        if key not in reduced:
+                            reduced.add(key)
+                            if build_forest:
+                                family = (production, tuple(labels[depth:]))
+                                label = symbols.get((lhs, start))
+                                if label is None:
+                                    label = symbols[(lhs, start)] = ForestNode(lhs, start, level, families=[family])
+                                elif family not in label.families:
+                                    label.families.append(family)
+                                del labels[depth:]
+                                labels.append(label)
+                            del states[depth:]
+                            del levels[depth:]
+                            states.append(target)
+                            levels.append(level)
+                            continue
+                # Anything else (several actions, accept, errors, reductions reaching into the graph)
+                # takes the general step. The nodes entered on this level below the top have taken
+                # their reductions already, but a node in the same state has to be merged with them.
+                frontier = {base.state: base} if base.level == level else {}
+                for i, state in enumerate(states):
+                    node = StackNode(state, levels[i])
+                    node.add_edge(base, labels[i] if build_forest else None)
+                    base = node
+                    if levels[i] == level:
+                        frontier[state] = node
+                created += len(states)
+                states = []
+                levels = []
+                labels = []
+                tops = [base]
+            else:
+                tops = list(frontier.values())
+
+            accepted, frontier, count = self.reduce_all(frontier, tops, level, token_type, lower,
+                                                        symbols if build_forest else None)
+            created += count
+            if accepted is not None:
+                self.stack_nodes = created
+                return accepted if build_forest else True
+            frontier = self.shift_all(frontier, level, token, build_forest)
+            if not frontier:
+                self.stack_nodes = created
+                return False
+            created += len(frontier)
+            level += 1
+            reduced = set()
+            symbols = {}
+            token = next(token_iterator, end_token)
+            if len(frontier) == 1:
+                (base,) = frontier.values()
+                frontier = None
+
+    def reduce_all(self, frontier, tops, level, token_type, lower, symbols=None):
+        # Performs every reduction possible on token_type at this level, starting from the nodes in
+        # tops (the rest of the frontier has reduced already), adding to the forest nodes in symbols
+        # (None when not building the forest). lower is the parse's LowerPaths. Returns (the start
+        # symbol's forest node or True if some stack accepts, else None; the level's nodes; nodes
+        # created).
+        actions = self.actions
+        gotos = self.gotos
+        lengths = self.lengths
+        productions = self.productions
+        build_forest = symbols is not None
+        frontier = dict(frontier)
+        work = []  # (node, production, edge every path has to take, or None)
+        # The same tree can be reduced along two paths (and a path reduced twice), so the families
+        # added on this level are kept, from the plain steps too, to add every one of them once
+        added = set()
+        if build_forest:
+            added.update((label, family) for label in symbols.values() for family in label.families)
+        created = 0
+
+        def queue(node, via):
+            for code in actions[node.state].get(token_type, ()):
+                if code < ACCEPT and (via is None or lengths[-code - 1]):
+                    work.append((node, -code - 1, via))
+
+        for node in tops:
+            queue(node, None)
+        while work:
+            node, production, via = work.pop()
+            lhs = productions[production][0]
+            for below, children in paths(node, production, lengths[production], lower, via):
+                target = gotos[below.state][lhs]
+                label = None
+                if build_forest:
+                    key = (lhs, below.level)
+                    label = symbols.get(key)
+                    if label is None:
+                        label = symbols[key] = ForestNode(lhs, below.level, level, families=[])
+                    family = (production, children)
+                    if (label, family) not in added:
+                        added.add((label, family))
+                        label.families.append(family)
+                top = frontier.get(target)
+                if top is None:
+                    top = frontier[target] = StackNode(target, level)
+                    top.add_edge(below, label)
+                    created += 1
+                    queue(top, None)
+                elif below not in top.edges:
+                    top.add_edge(below, label)
+                    # Reductions already done at this level may now also go through the new edge
+                    for other in list(frontier.values()):
+                        queue(other, (top, below))
+
+        for node in frontier.values():
+            if ACCEPT in actions[node.state].get(token_type, ()):
+                if not build_forest:
+                    return True, frontier, created
+                (label,) = node.edges.values()
+                return label, frontier, created
+        return None, frontier, created
+
+    def shift_all(self, frontier, level, token, build_forest):
+        actions = self.actions
+        token_type = token[0]
+        leaf = ForestNode(token_type, level, level + 1, token[1]) if build_forest else None
+        shifted = {}
+        for node in frontier.values():
+            for code in actions[node.state].get(token_type, ()):
+                if code > 0:
+                    top = shifted.get(code - 1)
+                    if top is None:
+                        top = shifted[code - 1] = StackNode(code - 1, level + 1)
+                    top.edges[node] = leaf
+        if not shifted:
+            states = sorted(frontier)
+            self.error = (f"No action defined for state {states[0]} and symbol '{token_type}'." if len(states) == 1
+                          else f"No action defined for states {states} and symbol '{token_type}'.")
+        return shifted
+
+
+def paths(node, production, length, lower, via=None):
+    # Every path of length edges down from node, as (node at the end, children: the forest nodes
+    # along the path in left-to-right order). The part of a path on node's level is followed edge by
+    # edge; the rest comes from lower (a LowerPaths), packed into one child. With via = (upper,
+    # bottom) only the paths through that edge: upper is on the current level, so the part of the
+    # path above it never leaves the level, instead of every path from node filtered afterwards.
+    level = node.level
+    stack = [(node, length, (), via is None)]  # The last item tells if the path took the edge via
+    while stack:
+        current, remaining, labels, passed = stack.pop()
+        if not remaining:
+            if passed:
+                yield current, labels
+        elif current.level < level:
+            if passed:
+                for end, prefix in lower.paths(current, remaining, production).items():
+                    yield end, prefix + labels
+        elif passed:
+            for below, label in current.edges.items():
+                stack.append((below, remaining - 1, (label,) + labels, True))
+        else:
+            upper, bottom = via
+            if current is upper:
+                stack.append((bottom, remaining - 1, (upper.edges[bottom],) + labels, True))
+            for below in current.flat:
+                stack.append((below, remaining - 1, (current.edges[below],) + labels, False))
+
+
+class LowerPaths:
+    # The paths down from the nodes below the current level, where no edge is added any more, so
+    # each is only followed once in a parse. All the ways to derive the first length symbols of a
+    # production over the same tokens make one intermediate forest node, so reducing by a long
+    # right-hand side never goes through every path again, and the forest stays cubic.
+    def __init__(self, build_forest=True):
+        self.build_forest = build_forest
+        self.found = {}  # By (node, length, production)
+        self.intermediate = {}  # By (production, length, start, end)
+        self.families = set()  # (intermediate node, family), as two paths can hold the same symbols
+
+    def paths(self, node, length, production):
+        # The paths of length edges down from node by the node they end at, each as the children
+        # standing for it: the forest node on its only edge, or an intermediate node
+        if not self.build_forest:
+            production = None  # Only the ends are needed, whatever the production
+        key = (node, length, production)
+        found = self.found.get(key)
+        if found is not None:
+            return found
+        if length == 1:
+            found = {below: (label,) for below, label in node.edges.items()}
+        elif not self.build_forest:
+            found = dict.fromkeys((end for below in node.edges for end in self.paths(below, length - 1, None)), ())
+        else:
+            found = {}
+            for below, label in node.edges.items():
+                for end, prefix in self.paths(below, length - 1, production).items():
+                    child = found.get(end)
+                    if child is None:
+                        span = (production, length, end.level, node.level)
+                        intermediate = self.intermediate.get(span)
+                        if intermediate is None:
+                            intermediate = self.intermediate[span] = ForestNode(None, end.level, node.level,
+                                                                                families=[])
+                        child = found[end] = (intermediate,)
+                    family = (None, prefix + (label,))
+                    if (child[0], family) not in self.families:
+                        self.families.add((child[0], family))
+                        child[0].families.append(family)
+        self.found[key] = found
+        return found
+
+
+def count_trees(root):
+    # Number of parse trees in the forest under root (inf when a cyclic grammar allows infinitely many)
+    with paused_gc():
+        return count_forest(root)
+
+
+def count_forest(root):
+    counts = {}  # By node id; None while the node is being counted, so meeting it again means a cycle
+    work = [(root, False)]
+    while work:
+        node, counted = work.pop()
+        if node.families is None:
+            continue
+        key = id(node)
+        if counted:
+            total = 0
+            for _, children in node.families:
+                product = 1
+                for child in children:
+                    if child.families is not None:
+                        count = counts[id(child)]
+                        product *= float('inf') if count is None else count
+                total += product
+            counts[key] = total
+        elif key not in counts:
+            counts[key] = None
+            work.append((node, True))
+            work.extend((child, False) for _, children in node.families for child in children)
+    return counts.get(id(root), 1)
+
+
+def first_tree(root, choose=None):
+    # One tree out of the forest, as nested tuples: (token type, value) for leaves and (symbol,
+    # children) for the rest, with the children of intermediate nodes in place of them. choose(node)
+    # picks the family index at every ambiguous node (the first family by default). A family that
+    # leads back into a node being expanded (only possible with a cyclic grammar) is passed over for
+    # the next one.
+    open_nodes = set()
+    values = []
+    work = [(root, None)]  # (node, None or, once expanded, where its children start in values)
+    while work:
+        node, mark = work.pop()
+        if node.families is None:
+            values.append((node.symbol, node.value))
+        elif mark is None:
+            if node.symbol is not None:
+                open_nodes.add(id(node))
+            families = node.families
+            index = choose(node) if choose is not None and len(families) > 1 else 0
+            for _, children in [families[index]] + families[:index] + families[index + 1:]:
+                if not any(is_blocked(child, open_nodes) for child in children):
+                    break
+            else:
+                raise ValueError(f"Only cyclic derivations for {node.symbol}")
+            work.append((node, len(values)))
+            work.extend((child, None) for child in reversed(children))
+        elif node.symbol is not None:
+            open_nodes.discard(id(node))
+            tree = (node.symbol, tuple(values[mark:]))
+            del values[mark:]
+            values.append(tree)
+    return values[0]
+
+
+def is_blocked(node, open_nodes):
+    # Whether every tree of node leads back into one of open_nodes, looking through intermediate nodes
+    if node.symbol is not None:
+        return id(node) in open_nodes
+    return all(any(is_blocked(child, open_nodes) for child in children) for _, children in node.families)
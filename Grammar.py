@@ -1,4 +1,10 @@
-from Parser import LR0Parser
+import copy
+
+from GrammarAnalysis import compute_first, compute_follow, compute_nullable, optimize_grammar, reachable_symbols
+
+# Marks an empty right-hand side in grammar files
+EPSILON = 'epsilon'
+
 
 class FormalGrammar:
     def __init__(self, filename):
@@ -7,6 +13,7 @@ class FormalGrammar:
         self.terminals = []
         self.productions = {}
         self.start = ''
+        self.changes = None  # What optimized() removed, on the grammars it returns
         self.read_from_file()
 
     def get_all_productions(self, non_terminal):
@@ -23,8 +30,51 @@ class FormalGrammar:
             if key not in self.non_terminals:
                 print(f"{key} is not a non-terminal")
                 return False
+        declared = set(self.non_terminals) | set(self.terminals)
+        for key, rhs_list in self.productions.items():
+            for rhs in rhs_list:
+                for symbol in rhs:
+                    if symbol not in declared:
+                        print(f"'{symbol}' in a production of {key} is not declared")
+                        return False
         return True
 
+    def unused_symbols(self):
+        # Declared symbols that no production uses (the start symbol and the epsilon marker aside)
+        used = {self.start, EPSILON}
+        for key, rhs_list in self.productions.items():
+            used.add(key)
+            for rhs in rhs_list:
+                used.update(rhs)
+        return [symbol for symbol in dict.fromkeys(self.non_terminals + self.terminals) if symbol not in used]
+
+    def analyze(self):
+        # The nullable nonterminals and the FIRST and FOLLOW sets of every nonterminal
+        nullable = compute_nullable(self.productions)
+        first = compute_first(self.productions, nullable)
+        follow = compute_follow(self.productions, self.start, first, nullable)
+        return nullable, first, follow
+
+    def optimized(self):
+        # A copy that derives the same strings with fewer productions (see optimize_grammar), with only
+        # the symbols it still uses declared. changes lists the nonterminals removed and why.
+        # Like the parser, it takes every symbol without productions for a terminal, declared non-terminals
+        # included.
+        symbols = [symbol for rhs_list in self.productions.values() for rhs in rhs_list for symbol in rhs]
+        terminals = [symbol for symbol in dict.fromkeys(self.terminals + symbols) if symbol not in self.productions]
+        grammar = copy.copy(self)
+        grammar.productions, grammar.changes = optimize_grammar(self.productions, self.start, terminals)
+        used = {symbol for rhs_list in grammar.productions.values() for rhs in rhs_list for symbol in rhs}
+        grammar.non_terminals = list(grammar.productions)
+        grammar.terminals = [symbol for symbol in terminals if symbol in used]
+        return grammar
+
+    def reachable_terminals(self):
+        # The symbols without productions (terminals, to the parser) that the start symbol reaches
+        reachable = reachable_symbols(self.productions, [self.start])
+        return {symbol for lhs in reachable for rhs in self.productions[lhs] for symbol in rhs
+                if symbol not in self.productions}
+
     def print_productions(self, non_terminal):
         print(f"Productions for {non_terminal}:")
         for production in self.productions[non_terminal]:
@@ -32,14 +82,16 @@ class FormalGrammar:
 
     def read_from_file(self):
         with open(self.filename) as file:
-            self.non_terminals = file.readline().strip().split(":").pop().strip().split(" ")
-            print(self.non_terminals)
-            self.terminals = file.readline().strip().split(":").pop().strip().split(" ")
-            self.start = file.readline().strip().split(":").pop().strip()
+            # Only the first colon ends the label, ':' can be a terminal
+            self.non_terminals = file.readline().strip().split(":", 1).pop().strip().split(" ")
+            self.terminals = file.readline().strip().split(":", 1).pop().strip().split(" ")
+            self.start = file.readline().strip().split(":", 1).pop().strip()
             for line in file:
                 production_str = line.strip().split("->")
                 key = production_str[0].strip()
                 value = production_str[1].strip().split(" ")
+                if value == [EPSILON]:  # An epsilon production has an empty right-hand side
+                    value = []
                 if key not in self.productions:
                     self.productions[key] = []
                 self.productions[key].append(value)
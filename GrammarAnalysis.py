@@ -0,0 +1,213 @@
+END_MARKER = '$'
+
+
+def compute_nullable(productions):
+    nullable = set()
+    changed = True
+    while changed:
+        changed = False
+        for lhs, rhs_list in productions.items():
+            if lhs not in nullable and any(all(symbol in nullable for symbol in rhs) for rhs in rhs_list):
+                nullable.add(lhs)
+                changed = True
+    return nullable
+
+
+def first_of_sequence(symbols, first, nullable):
+    # Returns the FIRST set of a symbol sequence and whether the whole sequence can derive epsilon
+    result = set()
+    for symbol in symbols:
+        if symbol in first:
+            result |= first[symbol]
+            if symbol not in nullable:
+                return result, False
+        else:  # Terminal
+            result.add(symbol)
+            return result, False
+    return result, True
+
+
+def compute_first(productions, nullable=None):
+    if nullable is None:
+        nullable = compute_nullable(productions)
+    first = {lhs: set() for lhs in productions}
+    changed = True
+    while changed:
+        changed = False
+        for lhs, rhs_list in productions.items():
+            for rhs in rhs_list:
+                symbols, _ = first_of_sequence(rhs, first, nullable)
+                if not symbols <= first[lhs]:
+                    first[lhs] |= symbols
+                    changed = True
+    return first
+
+
+def compute_follow(productions, start, first=None, nullable=None):
+    if nullable is None:
+        nullable = compute_nullable(productions)
+    if first is None:
+        first = compute_first(productions, nullable)
+    follow = {lhs: set() for lhs in productions}
+    follow[start].add(END_MARKER)
+    changed = True
+    while changed:
+        changed = False
+        for lhs, rhs_list in productions.items():
+            for rhs in rhs_list:
+                for i, symbol in enumerate(rhs):
+                    if symbol not in productions:
+                        continue
+                    symbols, rest_nullable = first_of_sequence(rhs[i + 1:], first, nullable)
+                    if rest_nullable:
+                        symbols = symbols | follow[lhs]
+                    if not symbols <= follow[symbol]:
+                        follow[symbol] |= symbols
+                        changed = True
+    return follow
+
+
+def digraph(nodes, edges, initial):
+    # DeRemer & Pennello's digraph algorithm: computes F(x) = initial(x) U { F(y) | x -> y }
+    # over a relation in one pass, collapsing strongly connected components (iterative Tarjan)
+    infinity = float('inf')
+    depth = {}
+    result = {}
+    stack = []
+    for root in nodes:
+        if root in depth:
+            continue
+        stack.append(root)
+        depth[root] = len(stack)
+        result[root] = set(initial.get(root, ()))
+        work = [(root, len(stack), iter(edges.get(root, ())))]
+        while work:
+            node, node_depth, successors = work[-1]
+            descended = False
+            for successor in successors:
+                if successor not in depth:
+                    stack.append(successor)
+                    depth[successor] = len(stack)
+                    result[successor] = set(initial.get(successor, ()))
+                    work.append((successor, len(stack), iter(edges.get(successor, ()))))
+                    descended = True
+                    break
+                depth[node] = min(depth[node], depth[successor])
+                result[node] |= result[successor]
+            if descended:
+                continue
+            work.pop()
+            if depth[node] == node_depth:
+                while True:
+                    top = stack.pop()
+                    depth[top] = infinity
+                    result[top] = result[node]
+                    if top == node:
+                        break
+            if work:
+                parent = work[-1][0]
+                depth[parent] = min(depth[parent], depth[node])
+                result[parent] |= result[node]
+    return result
+
+
+def productive_symbols(productions, terminals):
+    # Nonterminals that derive at least one string of terminals (same fixpoint as compute_nullable)
+    terminals = set(terminals)
+    productive = set()
+    changed = True
+    while changed:
+        changed = False
+        for lhs, rhs_list in productions.items():
+            if lhs not in productive and any(all(symbol in productive or symbol in terminals for symbol in rhs)
+                                             for rhs in rhs_list):
+                productive.add(lhs)
+                changed = True
+    return productive
+
+
+def reachable_symbols(productions, roots):
+    # Nonterminals that appear in some sentential form derived from one of roots (the roots included)
+    reachable = set()
+    work = [root for root in roots if root in productions]
+    while work:
+        lhs = work.pop()
+        if lhs in reachable:
+            continue
+        reachable.add(lhs)
+        work.extend(symbol for rhs in productions[lhs] for symbol in rhs if symbol in productions)
+    return reachable
+
+
+def remove_useless(productions, start, terminals):
+    # Drops the unproductive nonterminals with every production that uses one, then the nonterminals
+    # the start symbol can no longer reach. Returns the new productions and both lists of what went.
+    terminals = set(terminals)
+    productive = productive_symbols(productions, terminals)
+    if start not in productive:
+        raise ValueError(f"The start symbol {start} derives no string of terminals")
+    pruned = {lhs: [rhs for rhs in rhs_list if all(symbol in productive or symbol in terminals for symbol in rhs)]
+              for lhs, rhs_list in productions.items() if lhs in productive}
+    reachable = reachable_symbols(pruned, [start])
+    unproductive = [lhs for lhs in productions if lhs not in productive]
+    unreachable = [lhs for lhs in pruned if lhs not in reachable]
+    return {lhs: rhs_list for lhs, rhs_list in pruned.items() if lhs in reachable}, unproductive, unreachable
+
+
+def inline_chains(productions, start):
+    # Substitutes nonterminals that only cost the parser a reduction: aliases and empty ones (a single
+    # production with at most one symbol), everywhere they are used, and nonterminals used once,
+    # where it happens at the end of a right-hand side or they have a single production. Elsewhere
+    # every alternative would repeat the symbols after the use and the states for them. The start
+    # symbol and nonterminals used in their own productions stay. Returns the new productions and
+    # what was inlined.
+    productions = {lhs: [list(rhs) for rhs in rhs_list] for lhs, rhs_list in productions.items()}
+    inlined = []
+    changed = True
+    while changed:
+        changed = False
+        uses = {}  # Nonterminal -> [(lhs, index of the right-hand side, position in it)]
+        for lhs, rhs_list in productions.items():
+            for i, rhs in enumerate(rhs_list):
+                for position, symbol in enumerate(rhs):
+                    if symbol in productions:
+                        uses.setdefault(symbol, []).append((lhs, i, position))
+        for symbol, alternatives in productions.items():
+            symbol_uses = uses.get(symbol)
+            if symbol == start or not symbol_uses:
+                continue
+            alias = len(alternatives) == 1 and len(alternatives[0]) <= 1
+            if not alias:
+                if len(symbol_uses) > 1:
+                    continue
+                lhs, i, position = symbol_uses[0]
+                if len(alternatives) > 1 and position < len(productions[lhs][i]) - 1:
+                    continue
+            if any(symbol in rhs for rhs in alternatives):
+                continue
+            for lhs in dict.fromkeys(lhs for lhs, _, _ in symbol_uses):
+                rhs_list = []
+                for rhs in productions[lhs]:
+                    expanded = [[]]
+                    for other in rhs:
+                        if other == symbol:
+                            expanded = [prefix + alternative for prefix in expanded for alternative in alternatives]
+                        else:
+                            for prefix in expanded:
+                                prefix.append(other)
+                    rhs_list += [new_rhs for new_rhs in expanded if new_rhs not in rhs_list]
+                productions[lhs] = rhs_list
+            del productions[symbol]
+            inlined.append(symbol)
+            changed = True
+            break
+    return productions, inlined
+
+
+def optimize_grammar(productions, start, terminals):
+    # Same language from fewer nonterminals and productions, so that the LR automaton gets fewer
+    # states. Parse trees lose the nodes of the inlined nonterminals. Returns the new productions
+    # and {'unproductive', 'unreachable', 'inlined'}: the nonterminals removed at each step.
+    productions, unproductive, unreachable = remove_useless(productions, start, terminals)
+    productions, inlined = inline_chains(productions, start)
+    return productions, {'unproductive': unproductive, 'unreachable': unreachable, 'inlined': inlined}
@@ -1,58 +1,110 @@
+from array import array
+
+EMPTY = -1
+DELETED = -2
+
+
 class HashTable:
-    def __init__(self, size=10):
-        self.size = size
-        self.table = [None] * size
+    # Open-addressing symbol table (linear probing over a power-of-two slot array). Every symbol
+    # gets a unique id in insertion order that never changes, even when the table grows.
+    def __init__(self, size=8):
+        self.size = 8
+        while self.size < size:
+            self.size *= 2
+        self.slots = array('q', [EMPTY]) * self.size  # Symbol id stored in each slot
+        self.symbols = []  # Symbol text by id, None once deleted
+        self.hashes = []  # Hash by id, so growing never rehashes strings
+        self.count = 0  # Live symbols
+        self.used = 0  # Slots that are not EMPTY (live symbols and tombstones)
+        self.resizes = 0
+        self.collisions = 0
 
     def _hash(self, key):
-        return sum(ord(char) for char in key) % self.size
+        # SipHash through the built-in str hash; ids do not depend on it, only slot placement does
+        return hash(key)
 
     def _load_factor(self):
-        return sum(1 for i in range(len(self.table)) if self.table[i] is not None) / self.size
+        return self.used / self.size
+
+    def _find(self, value, key):
+        # Returns (slot holding value or -1, first slot where value could be inserted)
+        slots = self.slots
+        mask = self.size - 1
+        index = key & mask
+        free = -1
+        while True:
+            symbol_id = slots[index]
+            if symbol_id == EMPTY:
+                return -1, (index if free < 0 else free)
+            if symbol_id == DELETED:
+                if free < 0:
+                    free = index
+            elif self.hashes[symbol_id] == key and self.symbols[symbol_id] == value:
+                return index, free
+            self.collisions += 1
+            index = (index + 1) & mask
 
     def add(self, value):
-        self.resize()
         key = self._hash(value)
-        if self.table[key] is None:
-            self.table[key] = []
-        if value not in self.table[key]:
-            self.table[key].append(value)
+        index, free = self._find(value, key)
+        if index >= 0:
+            return self.slots[index]
+        symbol_id = len(self.symbols)
+        self.symbols.append(value)
+        self.hashes.append(key)
+        if self.slots[free] == EMPTY:
+            self.used += 1
+        self.slots[free] = symbol_id
+        self.count += 1
+        self.resize()
+        return symbol_id
 
     def contains(self, value):
-        key = self._hash(value)
-        if self.table[key] is not None:
-            if value in self.table[key]:
-                return True
-        return False
+        return self._find(value, self._hash(value))[0] >= 0
 
     def get_position(self, value):
-        key = self._hash(value)
-        if self.table[key] is not None:
-            return key
+        index, _ = self._find(value, self._hash(value))
+        if index >= 0:
+            return self.slots[index]
         return None
 
+    def get_symbol(self, position):
+        return self.symbols[position]
+
     def delete(self, value):
-        key = self._hash(value)
-        if self.table[key] is not None:
-            for i in range(len(self.table[key])):
-                if self.table[key][i] == value:
-                    self.table[key].pop(i)
-                    return True
-        return False
+        index, _ = self._find(value, self._hash(value))
+        if index < 0:
+            return False
+        self.symbols[self.slots[index]] = None
+        self.slots[index] = DELETED
+        self.count -= 1
+        return True
 
     def resize(self):
         if self._load_factor() > 0.7:
-            self.size *= 2
-            new_table = [None] * self.size
-            for i in range(len(self.table)):
-                if self.table[i] is not None:
-                    for j in range(len(self.table[i])):
-                        key = self._hash(self.table[i][j])
-                        if new_table[key] is None:
-                            new_table[key] = []
-                        new_table[key].append(self.table[i][j])
-            self.table = new_table
+            # Grow only if live symbols need it; otherwise this just clears tombstones
+            while self.count * 2 > self.size:
+                self.size *= 2
+            self.slots = array('q', [EMPTY]) * self.size
+            mask = self.size - 1
+            for symbol_id, symbol in enumerate(self.symbols):
+                if symbol is None:
+                    continue
+                index = self.hashes[symbol_id] & mask
+                while self.slots[index] != EMPTY:
+                    index = (index + 1) & mask
+                self.slots[index] = symbol_id
+            self.used = self.count
+            self.resizes += 1
 
-    def __str__(self):
-        return str(self.table)
+    def __len__(self):
+        return self.count
 
+    def __iter__(self):
+        # (id, symbol) pairs in id order
+        for symbol_id, symbol in enumerate(self.symbols):
+            if symbol is not None:
+                yield symbol_id, symbol
 
+    def __str__(self):
+        return str(dict(self))
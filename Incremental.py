@@ -0,0 +1,324 @@
+from array import array
+
+from GrammarAnalysis import END_MARKER
+from Lexer import CONSTANT, ERROR, IDENTIFIER, RESERVED
+from ParseTables import ACCEPT
+from Parser import ParserOutput
+
+# Tokens after which the parse stack is saved, so a later edit can resume from there
+BOUNDARIES = (';', '}')
+
+
+class ShiftedArray:
+    # Sorted integers where every entry from index moved on is stored shift too low, so moving
+    # everything behind an edit only touches the entries between the previous edit and this one
+    def __init__(self, values=()):
+        self.values = array('q', values)
+        self.moved = len(self.values)
+        self.shift = 0
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, index):
+        if index >= self.moved:
+            return self.values[index] + self.shift
+        return self.values[index]
+
+    def search(self, value, low=0):
+        # Index of the first entry >= value
+        high = len(self.values)
+        while low < high:
+            middle = (low + high) // 2
+            if self[middle] < value:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def replace(self, first, last, new_values, delta=0):
+        # Replaces entries [first, last) with new_values and adds delta to every entry after them
+        values = self.values
+        shift = self.shift
+        if shift:
+            if self.moved < first:
+                for index in range(self.moved, first):
+                    values[index] += shift
+            else:
+                for index in range(last, self.moved):
+                    values[index] -= shift
+        values[first:last] = array('q', new_values)
+        self.moved = first + len(new_values)
+        self.shift = shift + delta
+
+
+def same_stack(stack, other):
+    # Parse stacks are linked cells (state, node, below, depth) shared between versions, so two
+    # stacks in the same states are found equal as soon as both walks reach a common cell
+    if stack[3] != other[3]:
+        return False
+    while stack is not other:
+        if stack is None or other is None or stack[0] != other[0]:
+            return False
+        stack = stack[2]
+        other = other[2]
+    return True
+
+
+class IncrementalCompiler:
+    # Keeps the tokens and the parse of one source text in step with edits made to it. An edit
+    # relexes from the last token it cannot have influenced until the new tokens line up with the
+    # old ones again, and reparses from the last saved stack before the first changed token until
+    # the parser reaches an old saved stack in the same states (after which nothing can change).
+    # Tree nodes are tuples: (token type, value) for leaves, (symbol, children) for the rest.
+    def __init__(self, parser, lexer, text='', boundaries=BOUNDARIES):
+        self.parser = parser
+        self.lexer = lexer
+        self.boundaries = frozenset(boundaries)
+        self.set_text(text)
+
+    def set_text(self, text):
+        # Throws away all state and starts over on a new text
+        self.text = text
+        tokens, _ = self.lexer.scan_chunk(text, 0, final=True, with_reach=True)
+        self.types = []  # What the parser sees: the token itself for reserved words, else its class
+        self.values = []  # Text of identifiers and constants, None for everything else
+        starts, ends, reaches = array('q'), array('q'), array('q')
+        self.store_tokens(tokens, 0, self.types, self.values, starts, ends, reaches)
+        self.starts = ShiftedArray(starts)  # Offset of every token in the text
+        self.ends = ShiftedArray(ends)
+        self.reaches = ShiftedArray(reaches)  # End of the text the lexer looked at to decide every token
+        self.snapshot_indices = ShiftedArray()  # Tokens consumed when each saved stack was taken
+        self.snapshot_stacks = []
+        self.stop_indices = ShiftedArray()  # Tokens at which earlier parses failed
+        self.stop_messages = []
+        self.tree_valid = 0  # Leading snapshots whose stacks hold nodes for the current text
+        self.root = None
+        self.accepted = False
+        self.error = None
+        self.error_index = -1  # Token the parser failed at
+        self.relexed = len(tokens)
+        self.reparsed = 0
+        self.apply(-1, self.parse_from(-1), True)
+
+    @staticmethod
+    def store_tokens(tokens, offset, types, values, starts, ends, reaches):
+        for token_class, lexeme, start, reach in tokens:
+            if token_class == RESERVED:
+                types.append(lexeme)
+                values.append(None)
+            else:
+                types.append(token_class)
+                values.append(lexeme if token_class == IDENTIFIER or token_class == CONSTANT else None)
+            starts.append(start + offset)
+            ends.append(start + offset + len(lexeme))
+            reaches.append(reach + offset)
+
+    def edit(self, start, end, new_text):
+        # Replaces text[start:end] with new_text
+        old_text = self.text
+        text = old_text[:start] + new_text + old_text[end:]
+        delta = len(new_text) - (end - start)
+        new_end = start + len(new_text)
+        starts = self.starts
+        reaches = self.reaches
+
+        # Tokens never span lines, so tokens on earlier lines looked at most up to the newline
+        # before the edit; on the edited line every token that looked past start is relexed
+        line_start = old_text.rfind('\n', 0, start) + 1
+        first = starts.search(start)
+        index = first - 1
+        while index >= 0 and starts[index] >= line_start:
+            if reaches[index] > start:
+                first = index
+            index -= 1
+        position = self.ends[first - 1] if first else 0
+
+        # Relex in growing windows until a new token starts where an old one did (past the edit)
+        types, values = [], []
+        new_starts, new_ends, new_reaches = array('q'), array('q'), array('q')
+        last = len(starts)
+        window = max(4096, 2 * (new_end - position))
+        done = False
+        while not done:
+            limit = min(len(text), position + window)
+            final = limit == len(text)
+            tokens, consumed = self.lexer.scan_chunk(text[position:limit], 0, final, with_reach=True)
+            for count, token in enumerate(tokens):
+                token_start = position + token[2]
+                if token_start >= new_end:
+                    old_index = starts.search(token_start - delta, first)
+                    if old_index < len(starts) and starts[old_index] == token_start - delta:
+                        last = old_index
+                        tokens = tokens[:count]
+                        done = True
+                        break
+            self.store_tokens(tokens, position, types, values, new_starts, new_ends, new_reaches)
+            done = done or final
+            position += consumed
+            window *= 2
+        self.text = text
+
+        # Splice: tokens [first, last) are replaced, later tokens only move
+        self.types[first:last] = types
+        self.values[first:last] = values
+        starts.replace(first, last, new_starts, delta)
+        self.ends.replace(first, last, new_ends, delta)
+        reaches.replace(first, last, new_reaches, delta)
+        token_delta = len(types) - (last - first)
+        self.relexed = len(types)
+        self.reparsed = 0
+
+        # Stacks saved by earlier parses stay behind the current one as candidates for a later parse
+        # to converge with, and stops records where those parses failed. Whatever was saved in the
+        # edited region, or ahead of it past the current parse, is dropped; the rest only moves.
+        indices = self.snapshot_indices
+        stops = self.stop_indices
+        unchanged = not self.accepted and self.error_index < first  # The parse failed before the edit
+        if unchanged:
+            resume = indices.search(self.error_index + 1) - 1
+        else:
+            resume = indices.search(first + 1) - 1  # Last stack saved before token first was read
+        pending = indices.search(last, resume + 1)
+        indices.replace(resume + 1, pending, (), token_delta)
+        del self.snapshot_stacks[resume + 1:pending]
+        kept = 1 if unchanged else 0
+        stale = stops.search(last, kept)
+        stops.replace(kept, stale, (), token_delta)
+        del self.stop_messages[kept:stale]
+        if not unchanged:
+            self.apply(resume, self.parse_from(resume, converge=True), resume < self.tree_valid)
+
+    def apply(self, resume, outcome, nodes_valid):
+        _, root, valid = outcome
+        self.tree_valid = valid if nodes_valid else min(self.tree_valid, resume + 1)
+        # A parse that converged ends the way the old one did: at the first stop behind it, if any
+        self.root = root if nodes_valid else None
+        self.accepted = not self.stop_messages
+        if self.accepted:
+            self.error = None
+            self.error_index = -1
+        else:
+            self.error = self.stop_messages[0]
+            self.error_index = self.stop_indices[0]
+
+    def parse_from(self, resume, converge=False):
+        # Runs the parser from saved stack number resume (-1 for the start). The stacks saved after
+        # it are replaced by the ones saved on the way, up to the end of the input or, with converge
+        # set, up to the first old stack that is in the same states at the same token.
+        tables = self.parser.tables
+        terminal_ids = tables.terminal_ids
+        action_base = tables.action_base
+        action_check = tables.action_check
+        action_value = tables.action_value
+        check_size = len(action_check)
+        default_action = tables.default_action
+        goto_base = tables.goto_base
+        goto_value = tables.goto_value
+        terminal_count = tables.terminal_count
+        production_lhs = tables.production_lhs
+        production_lengths = tables.production_lengths
+        symbols = tables.symbols
+        boundaries = self.boundaries
+        types = self.types
+        values = self.values
+        indices = self.snapshot_indices
+        stacks = self.snapshot_stacks
+        if resume >= 0:
+            index = indices[resume]
+            stack = stacks[resume]
+        else:
+            index = 0
+            stack = (0, None, None, 0)  # Start state is always 0
+        new_indices = []
+        new_stacks = []
+        pending = resume + 1
+        parsed = 0
+        count = len(types)
+
+        while True:
+            while index < count and types[index] == ERROR:
+                index += 1  # Lexical errors are reported by the lexer, not fed to the parser
+            token_type = types[index] if index < count else END_MARKER
+            symbol_id = terminal_ids.get(token_type)
+            if symbol_id is None:
+                code = 0
+            else:
+                position = action_base[stack[0]] + symbol_id
+                if position < check_size and action_check[position] == stack[0]:
+                    code = action_value[position]
+                else:
+                    code = default_action[stack[0]]
+
+            if code > 0:  # Shift
+                stack = (code - 1, (token_type, values[index]), stack, stack[3] + 1)
+                index += 1
+                parsed += 1
+                if token_type in boundaries:
+                    new_indices.append(index)
+                    new_stacks.append(stack)
+                    if converge:
+                        while pending < len(stacks) and indices[pending] < index:
+                            pending += 1
+                        if (pending < len(stacks) and indices[pending] == index
+                                and same_stack(stack, stacks[pending])):
+                            indices.replace(resume + 1, pending + 1, new_indices)
+                            stacks[resume + 1:pending + 1] = new_stacks
+                            self.drop_stops(index)
+                            self.reparsed = parsed
+                            return 'converged', None, resume + 1 + len(new_stacks)
+            elif code < ACCEPT:  # Reduce
+                production = -code - 1
+                length = production_lengths[production]
+                if length == 1:
+                    children = (stack[1],)
+                    stack = stack[2]
+                else:
+                    children = [None] * length
+                    while length:
+                        length -= 1
+                        children[length] = stack[1]
+                        stack = stack[2]
+                    children = tuple(children)
+                lhs_id = production_lhs[production]
+                goto_state = goto_value[goto_base[stack[0]] + lhs_id - terminal_count]
+                stack = (goto_state, (symbols[lhs_id], children), stack, stack[3] + 1)
+            elif code == ACCEPT:
+                indices.replace(resume + 1, len(indices), new_indices)
+                stacks[resume + 1:] = new_stacks
+                self.drop_stops(len(types) + 1)
+                self.reparsed = parsed
+                return 'accept', stack[1], resume + 1 + len(new_stacks)
+            else:
+                # Old stacks past the error are kept for a later edit to converge with
+                saved = indices.search(index + 1, resume + 1)
+                indices.replace(resume + 1, saved, new_indices)
+                stacks[resume + 1:saved] = new_stacks
+                self.drop_stops(index + 1)
+                self.stop_indices.replace(0, 0, (index,))
+                self.stop_messages.insert(0, f"No action defined for state {stack[0]} and symbol '{token_type}'.")
+                self.reparsed = parsed
+                return 'error', None, resume + 1 + len(new_stacks)
+
+    def drop_stops(self, index):
+        # Forgets the stops before token index
+        count = self.stop_indices.search(index)
+        self.stop_indices.replace(0, count, ())
+        del self.stop_messages[:count]
+
+    def tree(self):
+        # Root node of the current parse (None if the text does not parse). Nodes past the first
+        # stale saved stack are rebuilt by parsing the rest of the input again.
+        if not self.accepted:
+            return None
+        if self.root is None:
+            resume = self.tree_valid - 1
+            self.apply(resume, self.parse_from(resume), True)
+        return self.root
+
+    def to_parser_output(self):
+        # Same tree as a ParserOutput, nodes numbered children first like LR0Parser builds them
+        root = self.tree()
+        if root is None:
+            return False
+        return ParserOutput.from_tuples(root)
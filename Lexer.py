@@ -0,0 +1,304 @@
+import hashlib
+import os
+import pickle
+import re
+from array import array
+
+from Files import atomic_write
+from FiniteAutomation import CharClasses, FiniteAutomation, hopcroft_minimize
+
+# Token classes in priority order: when several classes accept the same lexeme the first one wins
+RESERVED = 'reserved'
+IDENTIFIER = 'identifier'
+CONSTANT = 'constant'
+SKIP = 'skip'
+ERROR = 'error'
+PRIORITY = {RESERVED: 0, IDENTIFIER: 1, CONSTANT: 2, SKIP: 3}
+
+WHITESPACE = ' \t\r\n\f\v'
+# The original line splitter cut tokens at these characters, so identifiers and numeric constants
+# never contain them (e.g. "a-1" is "a", "-", "1", not "a", "-1")
+SEPARATORS = '()[]{};:=,<>+!-*/%'
+# What gets reported as a single invalid token when no class matches
+ERROR_RUN = re.compile(r'[^\s()\[\]{};:=,<>+!\-*/%"]+|\S')
+
+# Bump whenever the Lexer tables change layout so stale caches are rebuilt
+CACHE_VERSION = 1
+
+# Lexers already built in this process, by source file paths and modification times
+_lexers = {}
+
+
+def automaton_files(token_file, identifier_file=None, constant_file=None):
+    # The automata default to the ones next to the token file, else the ones shipped with this module,
+    # so the lexer does not depend on the current directory
+    def default(name):
+        path = os.path.join(os.path.dirname(token_file), name)
+        return path if os.path.exists(path) else os.path.join(os.path.dirname(os.path.abspath(__file__)), name)
+
+    return (identifier_file or default("fa_identifier.in"), constant_file or default("fa_numeric-const.in"))
+
+
+def load_lexer(token_file, identifier_file=None, constant_file=None, cache_file=None):
+    # Builds the lexer for these files once per process (again only if one of them changes). With
+    # cache_file the tables are also kept on disk, keyed by the contents of the three files.
+    paths = (token_file,) + automaton_files(token_file, identifier_file, constant_file)
+    key = []
+    for path in paths:
+        stat = os.stat(path)
+        key.append((os.path.abspath(path), stat.st_mtime_ns, stat.st_size))
+    key = tuple(key)
+    lexer = _lexers.get(key)
+    if lexer is None:
+        fingerprint = None
+        if cache_file is not None:
+            digest = hashlib.sha256(str(CACHE_VERSION).encode('utf-8'))
+            for path in paths:
+                with open(path, 'rb') as file:
+                    digest.update(file.read())
+                digest.update(b'\0')
+            fingerprint = digest.hexdigest()
+            lexer = load_cached_lexer(cache_file, fingerprint)
+        if lexer is None:
+            lexer = Lexer.from_files(*paths)
+            if cache_file is not None:
+                save_cached_lexer(cache_file, fingerprint, lexer)
+        _lexers[key] = lexer
+    return lexer
+
+
+def load_cached_lexer(cache_file, fingerprint):
+    try:
+        with open(cache_file, 'rb') as file:
+            data = pickle.load(file)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ValueError):
+        return None
+    if not isinstance(data, dict) or data.get('fingerprint') != fingerprint:
+        return None
+    return data['lexer']
+
+
+def save_cached_lexer(cache_file, fingerprint, lexer):
+    data = {'fingerprint': fingerprint, 'lexer': lexer}
+    return atomic_write(cache_file, lambda file: pickle.dump(data, file, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+class Component:
+    # One token class as a deterministic automaton over single characters. A state may have a
+    # default transition taken by every character without an explicit one (None marks a dead end).
+    def __init__(self, label, start):
+        self.label = label
+        self.start = start
+        self.transitions = {}
+        self.defaults = {}
+        self.final = set()
+
+    def step(self, state, char):
+        key = (state, char)
+        if key in self.transitions:
+            return self.transitions[key]
+        return self.defaults.get(state)
+
+    def states(self):
+        states = {self.start} | self.final | set(self.defaults)
+        for (state, _), target in self.transitions.items():
+            states.add(state)
+            states.add(target)
+        states.discard(None)
+        return states
+
+    def chars(self):
+        return {char for (_, char) in self.transitions}
+
+    @classmethod
+    def from_words(cls, label, words):
+        # A trie accepting exactly the given words
+        component = cls(label, '')
+        for word in words:
+            for i in range(len(word)):
+                component.transitions[(word[:i], word[i])] = word[:i + 1]
+            component.final.add(word)
+        return component
+
+    @classmethod
+    def from_automaton(cls, label, automaton, excluded=''):
+        component = cls(label, automaton.start)
+        for (state, char), target in automaton.transitions.items():
+            if char not in excluded:
+                component.transitions[(state, char)] = target
+        component.final = set(automaton.final)
+        return component
+
+    @classmethod
+    def string_literal(cls):
+        component = cls(CONSTANT, 0)
+        component.transitions[(0, '"')] = 1
+        component.transitions[(1, '"')] = 2
+        component.transitions[(1, '\n')] = None  # String literals end on their own line
+        component.defaults[1] = 1
+        component.final.add(2)
+        return component
+
+    @classmethod
+    def whitespace(cls):
+        component = cls(SKIP, 0)
+        for char in WHITESPACE:
+            component.transitions[(0, char)] = 1
+            component.transitions[(1, char)] = 1
+        component.final.add(1)
+        return component
+
+    @classmethod
+    def line_comment(cls):
+        component = cls(SKIP, 0)
+        component.transitions[(0, '/')] = 1
+        component.transitions[(1, '/')] = 2
+        component.transitions[(2, '\n')] = None
+        component.defaults[2] = 2
+        component.final.add(2)
+        return component
+
+
+class Lexer:
+    def __init__(self, components):
+        self.components = components
+        self.build_classes()
+        self.build_dfa()
+
+    @classmethod
+    def from_files(cls, token_file, identifier_file=None, constant_file=None):
+        identifier_file, constant_file = automaton_files(token_file, identifier_file, constant_file)
+        with open(token_file, 'r') as file:
+            reserved = [line.strip() for line in file if line.strip()]
+        return cls([
+            Component.from_words(RESERVED, reserved),
+            Component.from_automaton(IDENTIFIER, FiniteAutomation(identifier_file), SEPARATORS),
+            Component.from_automaton(CONSTANT, FiniteAutomation(constant_file), SEPARATORS),
+            Component.string_literal(),
+            Component.whitespace(),
+            Component.line_comment(),
+        ])
+
+    def build_classes(self):
+        # Characters that every component treats the same way share a character class;
+        # class 0 holds every character no component mentions explicitly
+        component_states = [(component, sorted(component.states(), key=str)) for component in self.components]
+
+        def signature(char):
+            return tuple(component.step(state, char) for component, states in component_states for state in states)
+
+        other = signature(None)
+        class_ids = {other: 0}
+        self.translation = CharClasses()
+        self.representatives = [None]
+        for char in sorted(set().union(*(component.chars() for component in self.components))):
+            key = signature(char)
+            if key not in class_ids:
+                class_ids[key] = len(self.representatives)
+                self.representatives.append(char)
+            self.translation[ord(char)] = chr(class_ids[key])
+        self.class_count = len(self.representatives)
+        if self.class_count > 256:
+            raise ValueError("Too many character classes for the lexer")
+
+    def build_dfa(self):
+        # Product construction over all components, then Hopcroft minimization
+        start = tuple(component.start for component in self.components)
+        index = {start: 0}
+        states = [start]
+        edges = []
+        i = 0
+        while i < len(states):
+            row = []
+            for char in self.representatives:
+                target = tuple(None if state is None else component.step(state, char)
+                               for component, state in zip(self.components, states[i]))
+                if all(state is None for state in target):
+                    row.append(-1)
+                    continue
+                if target not in index:
+                    index[target] = len(states)
+                    states.append(target)
+                row.append(index[target])
+            edges.append(row)
+            i += 1
+
+        labels = []
+        for state in states:
+            accepted = [component.label for component, sub_state in zip(self.components, state)
+                        if sub_state is not None and sub_state in component.final]
+            labels.append(min(accepted, key=PRIORITY.get) if accepted else None)
+
+        self.product_state_count = len(states)
+        self.minimize(edges, labels)
+
+    def minimize(self, edges, labels):
+        block_of, dead = hopcroft_minimize(edges, labels)
+
+        # Renumber so the start state is 0; states merged into the dead block become -1
+        order = {dead: -1}
+        for block in [block_of[0]] + block_of:
+            if block not in order:
+                order[block] = len(order) - 1
+        self.state_count = len(order) - 1
+        self.start = 0
+        self.table = array('i', [-1] * (self.state_count * self.class_count))
+        self.accept = [None] * self.state_count
+        for state, row in enumerate(edges):
+            new_state = order[block_of[state]]
+            if new_state < 0:
+                continue
+            self.accept[new_state] = labels[state]
+            for class_id, target in enumerate(row):
+                if target >= 0:
+                    self.table[new_state * self.class_count + class_id] = order[block_of[target]]
+
+    def tokenize(self, text, position=0):
+        # Single maximal-munch pass over the whole buffer; yields (class, lexeme, offset) and
+        # ('error', lexeme, offset) for text no class accepts. Whitespace and comments are dropped.
+        tokens, _ = self.scan_chunk(text, position, final=True)
+        return iter(tokens)
+
+    def scan_chunk(self, text, position=0, final=True, with_reach=False):
+        # Same as tokenize for one chunk of a larger input. Unless final is set, a token (or
+        # comment, or error run) that reaches the end of the chunk could still grow, so scanning
+        # stops in front of it. Returns the tokens and the offset the next chunk must start from.
+        # with_reach adds a fourth field to every token: the end of the text the automaton had to
+        # look at to decide it (len(text) + 1 when it ran into the end of the input).
+        codes = text.translate(self.translation).encode('latin-1')
+        table = self.table
+        accept = self.accept
+        width = self.class_count
+        start = self.start
+        length = len(codes)
+        tokens = []
+        while position < length:
+            state = start
+            i = position
+            token_end = -1
+            token_label = None
+            while i < length:
+                state = table[state * width + codes[i]]
+                if state < 0:
+                    break
+                i += 1
+                label = accept[state]
+                if label is not None:
+                    token_end = i
+                    token_label = label
+            if i == length and state >= 0 and not final:
+                break
+            reach = i + 1
+            if token_end < 0:
+                token_end = ERROR_RUN.match(text, position).end()
+                if token_end == length and not final:
+                    break
+                token_label = ERROR
+                reach = max(reach, token_end + 1)
+            if token_label != SKIP:
+                if with_reach:
+                    tokens.append((token_label, text[position:token_end], position, reach))
+                else:
+                    tokens.append((token_label, text[position:token_end], position))
+            position = token_end
+        return tokens, position
@@ -0,0 +1,134 @@
+from array import array
+from collections import Counter
+
+from GrammarAnalysis import END_MARKER
+
+# Integer action codes: 0 is an error, n > 0 shifts to state n - 1 and n < 0 reduces by
+# production -n - 1. Reducing by production 0 (the augmented start production) means accept.
+ERROR = 0
+ACCEPT = -1
+
+
+def encode_shift(state):
+    return state + 1
+
+
+def encode_reduce(production):
+    return -production - 1
+
+
+def pack_rows(rows, with_check=True):
+    # Row-displacement compression: every row is placed at the lowest offset where its
+    # non-empty cells fit into the holes left by the rows placed before it. Every slot below
+    # first_free is taken, and only offsets that put the row's first column on a free slot
+    # (found by bytearray.find) are tried, so placing a row does not scan every offset.
+    base = array('i', [0] * len(rows))
+    value = array('i')
+    check = array('i')
+    occupied = bytearray()
+    first_free = 0
+    for row_id in sorted(range(len(rows)), key=lambda r: -len(rows[r])):
+        row = rows[row_id]
+        if not row:
+            continue
+        columns = sorted(column for column, _ in row)
+        first = columns[0]
+        offset = max(0, first_free - first)
+        while True:
+            slot = occupied.find(0, offset + first)
+            if slot < 0:  # Everything from the end of the table on is free
+                offset = max(offset, len(occupied) - first)
+                break
+            offset = slot - first
+            size = len(occupied)
+            if all(offset + column >= size or not occupied[offset + column] for column in columns):
+                break
+            offset += 1
+        end = offset + columns[-1] + 1
+        if end > len(occupied):
+            grow = end - len(occupied)
+            occupied.extend(bytes(grow))
+            value.extend([0] * grow)
+            check.extend([-1] * grow)
+        for column, cell in row:
+            occupied[offset + column] = 1
+            value[offset + column] = cell
+            check[offset + column] = row_id
+        base[row_id] = offset
+        first_free = occupied.find(0, first_free)
+        if first_free < 0:
+            first_free = len(occupied)
+    return base, value, (check if with_check else None)
+
+
+class CompactTables:
+    def __init__(self, parser):
+        # Terminals (with the end marker first) get the low ids, nonterminals follow them
+        terminals = [END_MARKER]
+        for symbol in parser.terminals:
+            if symbol not in parser.grammar and symbol not in terminals:
+                terminals.append(symbol)
+        for (_, symbol) in parser.action:
+            if symbol not in terminals:
+                terminals.append(symbol)
+        self.terminal_count = len(terminals)
+        self.symbols = terminals + list(parser.grammar)
+        self.symbol_ids = {symbol: i for i, symbol in enumerate(self.symbols)}
+        # What the parse loop uses to map a token type to a column; anything else is a syntax error
+        self.terminal_ids = {symbol: i for i, symbol in enumerate(terminals)}
+
+        self.production_lhs = array('i', (self.symbol_ids[lhs] for lhs, _ in parser.productions))
+        self.production_lengths = array('i', (len(rhs) for _, rhs in parser.productions))
+
+        state_count = len(parser.states)
+        action_rows = [{} for _ in range(state_count)]
+        for (state, symbol), value in parser.action.items():
+            action_rows[state][self.symbol_ids[symbol]] = self.encode(parser, value)
+        goto_rows = [[] for _ in range(state_count)]
+        for (state, symbol), target in parser.goto_table.items():
+            goto_rows[state].append((self.symbol_ids[symbol] - self.terminal_count, target))
+
+        # Each state's most common reduction becomes its default action and is dropped from the row
+        self.default_action = array('i', [ERROR] * state_count)
+        for state, row in enumerate(action_rows):
+            reductions = Counter(code for code in row.values() if code < ACCEPT)
+            if reductions:
+                default, _ = reductions.most_common(1)[0]
+                self.default_action[state] = default
+                action_rows[state] = {column: code for column, code in row.items() if code != default}
+        self.action_base, self.action_value, self.action_check = pack_rows(
+            [sorted(row.items()) for row in action_rows])
+        # Gotos are only consulted after a valid reduction, so they never need a check array
+        self.goto_base, self.goto_value, _ = pack_rows(goto_rows, with_check=False)
+
+    @staticmethod
+    def encode(parser, value):
+        if value[0] == 'shift':
+            return encode_shift(value[1])
+        if value[0] == 'accept':
+            return ACCEPT
+        return encode_reduce(parser.production_ids[(value[1], tuple(value[2]))])
+
+    def action(self, state, symbol_id):
+        index = self.action_base[state] + symbol_id
+        if index < len(self.action_check) and self.action_check[index] == state:
+            return self.action_value[index]
+        return self.default_action[state]
+
+    def goto(self, state, nonterminal_id):
+        return self.goto_value[self.goto_base[state] + nonterminal_id - self.terminal_count]
+
+    def decode(self, code, parser):
+        # Turns an integer action back into the tuple form used by LR0Parser.action
+        if code == ERROR:
+            return None
+        if code > 0:
+            return ('shift', code - 1)
+        if code == ACCEPT:
+            return ('accept',)
+        return ('reduce',) + tuple(parser.productions[-code - 1])
+
+    def memory_size(self):
+        arrays = (self.production_lhs, self.production_lengths, self.default_action, self.action_base,
+                  self.action_value, self.action_check, self.goto_base, self.goto_value)
+        return sum(len(a) * a.itemsize for a in arrays)
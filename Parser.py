@@ -1,23 +1,59 @@
+import hashlib
+import os
+import pickle
+from array import array
+from contextlib import nullcontext
+from sys import intern
+
+from Files import atomic_write
+from Grammar import FormalGrammar
+from GrammarAnalysis import END_MARKER, compute_follow, compute_nullable, digraph
+from ParseTables import ACCEPT, ERROR, CompactTables
+
+# Bump whenever the layout of the cached tables changes so stale caches are rebuilt
+CACHE_VERSION = 6
+
+# Events passed to the LR0Parser.set_trace hook
+SHIFT = 'shift'
+REDUCE = 'reduce'
+GOTO = 'goto'
+ACCEPT_EVENT = 'accept'
+ERROR_EVENT = 'error'
+
+# Table construction methods accepted by LR0Parser, with the grammar class each one recognizes
+METHODS = {'lr0': 'LR(0)', 'slr': 'SLR(1)', 'lalr': 'LALR(1)'}
+
+# Parsers already built in this process, by grammar file, its modification time and the settings
+_parsers = {}
+
+
 class LR0Item:
-    def __init__(self, lhs, rhs, dot):
+    # Items are interned per parser (one object per production and dot position), so they are
+    # kept small with __slots__ and hash with a value computed once up front
+    __slots__ = ('lhs', 'rhs', 'dot', 'production', 'symbol', '_hash')
+
+    def __init__(self, lhs, rhs, dot, production=None):
         self.lhs = lhs  # Left-hand side of the production
         self.rhs = rhs  # Right-hand side of the production
         self.dot = dot  # Position of the dot in the production
+        self.production = production  # Index of the production in LR0Parser.productions, if known
+        self.symbol = None if dot >= len(rhs) else rhs[dot]  # Symbol after the dot
+        self._hash = hash((lhs, tuple(rhs), dot))
 
     def __repr__(self):
-        return f"{self.lhs} -> {' '.join(self.rhs[:self.dot] + ['.'] + self.rhs[self.dot:])}"
+        return f"{self.lhs} -> {' '.join(list(self.rhs[:self.dot]) + ['.'] + list(self.rhs[self.dot:]))}"
 
     def next_symbol(self):
-        return None if self.dot >= len(self.rhs) else self.rhs[self.dot]
+        return self.symbol
 
     def is_complete(self):
-        return self.dot >= len(self.rhs)
+        return self.symbol is None
 
     def __eq__(self, other):
-        return (self.lhs == other.lhs and self.rhs == other.rhs and self.dot == other.dot)
+        return self is other or (self.lhs == other.lhs and self.rhs == other.rhs and self.dot == other.dot)
 
     def __hash__(self):
-        return hash((self.lhs, tuple(self.rhs), self.dot))
+        return self._hash
 
 
 def read_scanner_output(file_path):
@@ -59,105 +95,322 @@ def convert_tokens(scanner_tokens, symbol_table):
     return converted_tokens
 
 
+def grammar_fingerprint(grammar, start_symbol, terminals, method='lr0'):
+    # Production order matters: it decides how states get numbered
+    key = (CACHE_VERSION, method, start_symbol, list(terminals),
+           [(lhs, [list(rhs) for rhs in productions]) for lhs, productions in grammar.items()])
+    return hashlib.sha256(repr(key).encode('utf-8')).hexdigest()
+
+
+def prebuild_cache(grammar, start_symbol, terminals, cache_file, method='lr0'):
+    # Build (or refresh) the cache ahead of time, e.g. as a build step
+    return LR0Parser(grammar, start_symbol, terminals, cache_file=cache_file, method=method)
+
+
+def invalidate_cache(cache_file):
+    try:
+        os.remove(cache_file)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def load_parser(grammar_file, cache_file=None, method='lalr', profiler=None, optimize=False):
+    # Builds the parser for a grammar file once per process (again only if the file changes); the
+    # profiler, if any, is attached to the parser that is returned. With optimize the tables come from
+    # FormalGrammar.optimized() (cached in optimized_cache_file(cache_file)), unless that grammar could
+    # accept other strings (see optimized_parser): the original one is used then.
+    stat = os.stat(grammar_file)
+    key = (os.path.abspath(grammar_file), stat.st_mtime_ns, stat.st_size, cache_file, method, optimize)
+    parser = _parsers.get(key)
+    if parser is None:
+        grammar = FormalGrammar(grammar_file)
+        if optimize:
+            parser = optimized_parser(grammar, cache_file, method, profiler)
+            if parser is None:
+                parser = load_parser(grammar_file, cache_file, method, profiler)
+        else:
+            parser = LR0Parser(grammar.productions, grammar.start, grammar.terminals, cache_file=cache_file,
+                               method=method, profiler=profiler)
+        _parsers[key] = parser
+    parser.profiler = profiler
+    return parser
+
+
+def optimized_parser(grammar, cache_file, method, profiler):
+    # The parser for grammar.optimized(), or None if it could accept other strings than the grammar:
+    # when the optimized grammar has conflicts, or its terminals (the symbols without productions)
+    # are not the ones the original reaches, e.g. a declared non-terminal that has no productions
+    optimized = grammar.optimized()
+    if (optimized.reachable_terminals() != grammar.reachable_terminals()
+            or not set(optimized.productions) <= set(grammar.productions)):
+        return None
+    parser = LR0Parser(optimized.productions, optimized.start, optimized.terminals,
+                       cache_file=optimized_cache_file(cache_file), method=method, profiler=profiler)
+    return None if parser.conflicts else parser
+
+
+def optimized_cache_file(cache_file):
+    # grammar.in.cache -> grammar.in.optimized.cache
+    if cache_file is None:
+        return None
+    root, extension = os.path.splitext(cache_file)
+    return f"{root}.optimized{extension}"
+
+
 class LR0Parser:
-    def __init__(self, grammar, start_symbol, terminals):
+    def __init__(self, grammar, start_symbol, terminals, cache_file=None, method='lr0', profiler=None):
+        if method not in METHODS:
+            raise ValueError(f"Unknown parsing method '{method}', expected one of {list(METHODS)}")
+        self.method = method
         self.conflicts = []
         augmented_start_symbol = f"{start_symbol}'"
-        self.grammar = grammar.copy()
-        self.grammar[augmented_start_symbol] = [[start_symbol]]
+        # The augmented production always gets index 0
+        self.grammar = {augmented_start_symbol: [[start_symbol]]}
+        self.grammar.update((lhs, rhs_list) for lhs, rhs_list in grammar.items() if lhs != augmented_start_symbol)
         self.start_symbol = augmented_start_symbol
         self.terminals = terminals
+        self.productions = []
+        self.production_ids = {}
+        for lhs, rhs_list in self.grammar.items():
+            for rhs in rhs_list:
+                self.production_ids.setdefault((lhs, tuple(rhs)), len(self.productions))
+                self.productions.append((lhs, rhs))
+        # self.items[production][dot] is the single interned item for that position
+        self.items = [[LR0Item(lhs, rhs, dot, production) for dot in range(len(rhs) + 1)]
+                      for production, (lhs, rhs) in enumerate(self.productions)]
+        self.item_count = sum(len(items) for items in self.items)  # Items created, interned or not
+        self.closure_count = 0
+        self.nonterminal_closures = self.compute_nonterminal_closures()
         self.states = []
         self.action = {}
         self.goto_table = {}
-        self.construct_states()
-        self.build_parsing_table()
+        self.transitions = {}
+        self.tables = None
+        self.trace = None
+        self.error = None
+        self.profiler = profiler
+        self.cache_file = cache_file
+        self.fingerprint = grammar_fingerprint(self.grammar, self.start_symbol, self.terminals, self.method)
+        loaded = False
+        if cache_file is not None:
+            with self.phase('load_tables'):
+                loaded = self.load_cache()
+        if not loaded:
+            with self.phase('construct_states'):
+                self.construct_states()
+            with self.phase('build_parsing_table'):
+                self.build_parsing_table()
+            with self.phase('compact_tables'):
+                self.tables = CompactTables(self)
+            if cache_file is not None:
+                with self.phase('save_tables'):
+                    self.save_cache()
+        if profiler is not None:
+            profiler.count('closures', self.closure_count)
+            profiler.count('items', self.item_count)
+            profiler.count('states', len(self.states))
+            profiler.count('conflicts', len(self.conflicts))
+
+    def phase(self, name):
+        return self.profiler.phase(name) if self.profiler is not None else nullcontext()
+
+    def load_cache(self):
+        if self.cache_file is None:
+            return False
+        try:
+            with open(self.cache_file, 'rb') as file:
+                data = pickle.load(file)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ValueError):
+            return False
+        if not isinstance(data, dict) or data.get('fingerprint') != self.fingerprint:
+            return False
+
+        # States are stored as (production index, dot) pairs instead of full items
+        self.states = [{self.items[production][dot] for production, dot in state} for state in data['states']]
+        self.action = data['action']
+        self.goto_table = data['goto_table']
+        self.transitions = data['transitions']
+        self.conflicts = data['conflicts']
+        self.tables = data['tables']
+        return True
+
+    def save_cache(self):
+        if self.cache_file is None:
+            return False
+        states = [sorted((item.production, item.dot) for item in state) for state in self.states]
+        data = {
+            'fingerprint': self.fingerprint,
+            'states': states,
+            'action': self.action,
+            'goto_table': self.goto_table,
+            'transitions': self.transitions,
+            'conflicts': self.conflicts,
+            'tables': self.tables,
+        }
+        return atomic_write(self.cache_file, lambda file: pickle.dump(data, file, protocol=pickle.HIGHEST_PROTOCOL))
+
+    def invalidate_cache(self):
+        if self.cache_file is None:
+            return False
+        return invalidate_cache(self.cache_file)
+
+    def compute_nonterminal_closures(self):
+        # Closure of {A -> . alpha} for every nonterminal A, computed once per grammar
+        closures = {}
+        for nonterminal in self.grammar:
+            closure = set()
+            pending = [nonterminal]
+            seen = {nonterminal}
+            while pending:
+                symbol = pending.pop()
+                for rhs in self.grammar[symbol]:
+                    item = self.items[self.production_ids[(symbol, tuple(rhs))]][0]
+                    closure.add(item)
+                    if item.symbol in self.grammar and item.symbol not in seen:
+                        seen.add(item.symbol)
+                        pending.append(item.symbol)
+            closures[nonterminal] = frozenset(closure)
+        return closures
+
+    def item(self, lhs, rhs, dot):
+        production = self.production_ids.get((lhs, tuple(rhs)))
+        if production is None:
+            self.item_count += 1
+            return LR0Item(lhs, rhs, dot)
+        return self.items[production][dot]
+
+    def advance(self, item):
+        if item.production is None:
+            return self.item(item.lhs, item.rhs, item.dot + 1)
+        return self.items[item.production][item.dot + 1]
 
     def closure(self, items):
+        self.closure_count += 1
         closure = set(items)
-        while True:
-            new_items = set()
-            for item in closure:
-                symbol = item.next_symbol()
-                if symbol and symbol in self.grammar:
-                    for prod in self.grammar[symbol]:
-                        new_item = LR0Item(symbol, prod, 0)
-                        if new_item not in closure:
-                            new_items.add(new_item)
-            if not new_items:
-                return closure
-            closure |= new_items
+        for item in items:
+            nonterminal_closure = self.nonterminal_closures.get(item.symbol)
+            if nonterminal_closure is not None:
+                closure |= nonterminal_closure
+        return closure
 
     def compute_goto(self, items, symbol):
-        return self.closure(
-            {LR0Item(item.lhs, item.rhs, item.dot + 1) for item in items if item.next_symbol() == symbol})
+        return self.closure({self.advance(item) for item in items if item.symbol == symbol})
 
     def construct_states(self):
-        initial_item = LR0Item(self.start_symbol, [self.grammar[self.start_symbol][0][0]], 0)
-        self.states.append(self.closure({initial_item}))
+        initial_item = self.items[0][0]
+        self.states = [self.closure({initial_item})]
+        self.transitions = {}
+        # States are identified by their kernel, so a new goto target is deduplicated with one lookup
+        kernel_index = {frozenset({initial_item}): 0}
 
-        while True:
-            new_states = []
-            for state in self.states:
-                symbols_after_dot = set()
-                for item in state:
-                    if item.next_symbol():  # Check if there is a symbol after the dot
-                        symbols_after_dot.add(item.next_symbol())
-                for symbol in symbols_after_dot:
-                    goto_state = self.compute_goto(state, symbol)
-                    if goto_state not in self.states and goto_state not in new_states:
-                        new_states.append(goto_state)
-            if not new_states:
-                break
-            self.states.extend(new_states)
+        # self.states doubles as the worklist: every state is expanded exactly once, in creation order
+        i = 0
+        while i < len(self.states):
+            kernels = {}
+            for item in self.states[i]:
+                if item.symbol is not None:
+                    kernels.setdefault(item.symbol, set()).add(self.advance(item))
+            # Sorted so states get the same numbers in every process (items hash differently per run)
+            for symbol in sorted(kernels):
+                kernel = frozenset(kernels[symbol])
+                target = kernel_index.get(kernel)
+                if target is None:
+                    target = len(self.states)
+                    kernel_index[kernel] = target
+                    self.states.append(self.closure(kernel))
+                self.transitions[(i, symbol)] = target
+            i += 1
+
+    def add_action(self, action_key, action_value):
+        if action_key in self.action:
+            if self.action[action_key] != action_value:
+                self.conflicts.append((action_key, self.action[action_key], action_value))
+        else:
+            self.action[action_key] = action_value
 
     def build_parsing_table(self):
         self.conflicts = []
+        # Shifts and gotos come straight from the transitions recorded by construct_states
+        for action_key, target in self.transitions.items():
+            if action_key[1] in self.grammar:  # Non-terminal
+                self.goto_table[action_key] = target
+            else:  # Terminal
+                self.add_action(action_key, ('shift', target))
+
+        lookaheads = self.compute_lookaheads()
         for i, state in enumerate(self.states):
-            for item in state:
-                symbol = item.next_symbol()
-                if symbol:
-                    goto_state = self.compute_goto(state, symbol)
-                    action_key = (i, symbol)
-                    if goto_state in self.states:
-                        if symbol in self.grammar:  # Non-terminal
-                            self.goto_table[action_key] = self.states.index(goto_state)
-                        else:  # Terminal
-                            action_value = ('shift', self.states.index(goto_state))
-                            if action_key in self.action:
-                                if self.action[action_key] != action_value:
-                                    self.conflicts.append((action_key, self.action[action_key], action_value))
-                            else:
-                                self.action[action_key] = action_value
-                elif item.is_complete():
-                    action_key = (i, '$')
-                    if item.lhs == 'S\'':
-                        action_value = ('accept',)
-                    else:
-                        action_value = ('reduce', item.lhs, item.rhs)
-                    if action_key in self.action:
-                        if self.action[action_key] != action_value:
-                            self.conflicts.append((action_key, self.action[action_key], action_value))
-                    else:
-                        self.action[action_key] = action_value
-
-                    action_key = (i, '$')
-                    if not item.lhs == 'S\'':
-                        for symbol in self.terminals:
-                            action_key = (i, symbol)
-                            action_value = ('reduce', item.lhs, item.rhs)
-                            if action_key in self.action:
-                                if self.action[action_key] != action_value:
-                                    self.conflicts.append((action_key, self.action[action_key], action_value))
-                            else:
-                                self.action[action_key] = action_value
+            # In production order, so conflicts are always resolved (and reported) the same way
+            for item in sorted((item for item in state if item.is_complete()), key=lambda item: item.production):
+                if item.lhs == self.start_symbol:
+                    self.add_action((i, END_MARKER), ('accept',))
+                else:
+                    action_value = ('reduce', item.lhs, item.rhs)
+                    for symbol in sorted(lookaheads(i, item)):
+                        self.add_action((i, symbol), action_value)
 
         if self.conflicts:
             print("Conflicts found in the parsing table:")
             for conflict in self.conflicts:
-                state, symbol, actions = conflict
-                print(f"Conflict in state {state} on symbol '{symbol}': {actions}")
-            print("The grammar is not LR(0).")
+                (state, symbol), existing, action = conflict
+                print(f"Conflict in state {state} on symbol '{symbol}': {existing} / {action}")
+            print(f"The grammar is not {METHODS[self.method]}.")
+
+    def compute_lookaheads(self):
+        # Returns a function giving the terminals on which a completed item of a state is reduced
+        if self.method == 'lr0':
+            every_terminal = [END_MARKER] + [symbol for symbol in self.terminals if symbol != END_MARKER]
+            return lambda state, item: every_terminal
+        if self.method == 'slr':
+            follow = compute_follow(self.grammar, self.start_symbol)
+            return lambda state, item: follow[item.lhs]
+        lookaheads = self.compute_lalr_lookaheads()
+        return lambda state, item: lookaheads.get((state, item.production), ())
+
+    def compute_lalr_lookaheads(self):
+        # DeRemer & Pennello: LALR(1) lookaheads from the LR(0) automaton through the
+        # reads/includes relations on nonterminal transitions
+        nullable = compute_nullable(self.grammar)
+        nonterminal_transitions = [key for key in self.transitions if key[1] in self.grammar]
+
+        direct_reads = {}
+        reads = {}
+        for state, nonterminal in nonterminal_transitions:
+            target = self.transitions[(state, nonterminal)]
+            direct_reads[(state, nonterminal)] = terminals = set()
+            reads[(state, nonterminal)] = read_edges = []
+            for item in self.states[target]:
+                symbol = item.symbol
+                if symbol is None:
+                    continue
+                if symbol not in self.grammar:
+                    terminals.add(symbol)
+                elif symbol in nullable:
+                    read_edges.append((target, symbol))
+            if state == 0 and nonterminal == self.grammar[self.start_symbol][0][0]:
+                terminals.add(END_MARKER)
+        read_sets = digraph(nonterminal_transitions, reads, direct_reads)
+
+        includes = {}
+        lookback = {}
+        for state, nonterminal in nonterminal_transitions:
+            for rhs in self.grammar[nonterminal]:
+                production = self.production_ids[(nonterminal, tuple(rhs))]
+                path = [state]
+                for symbol in rhs:
+                    path.append(self.transitions[(path[-1], symbol)])
+                for i in range(len(rhs) - 1, -1, -1):
+                    if rhs[i] in self.grammar:
+                        includes.setdefault((path[i], rhs[i]), []).append((state, nonterminal))
+                    if rhs[i] not in nullable:
+                        break
+                lookback.setdefault((path[-1], production), []).append((state, nonterminal))
+        follow_sets = digraph(nonterminal_transitions, includes, read_sets)
+
+        lookaheads = {}
+        for key, transitions in lookback.items():
+            lookaheads[key] = set().union(*(follow_sets[transition] for transition in transitions))
+        return lookaheads
 
     def check_conflicts(self):
         if self.conflicts:
@@ -167,7 +420,12 @@ class LR0Parser:
             return True
         return False
 
-    def parse_string(self, input_string):
+    def set_trace(self, hook):
+        # hook(event, state, token, detail) is called for every SHIFT, REDUCE, GOTO, ACCEPT and
+        # ERROR step; pass None to go back to the untraced loop
+        self.trace = hook
+
+    def dump_tables(self):
         # Print the states
         print("States:")
         for i, state in enumerate(self.states):
@@ -185,175 +443,255 @@ class LR0Parser:
             state, symbol = key
             print(f"State {state}, Symbol '{symbol}': {value}")
 
+    def parse_string(self, input_string, build_tree=True):
+        input_symbols = input_string.split(" ")
+        return self.run_parser([(symbol, None) for symbol in input_symbols], build_tree)
+
+    def parse_tokens(self, tokens, build_tree=True):
+        return self.run_parser(tokens, build_tree)
+
+    def recognize(self, tokens):
+        return self.run_parser(tokens, build_tree=False)
+
+    def run_parser(self, tokens, build_tree=True):
+        # Returns the ParserOutput (or just True when build_tree is off), or False after
+        # setting self.error
+        if not build_tree:
+            accepted, _ = self.drive(tokens)
+            return accepted
         parser_output = ParserOutput()
+        accepted, _ = self.drive(tokens,
+                                 lambda token: parser_output.add_node(token[0]),
+                                 lambda lhs, rhs, child_ids: parser_output.add_parent(lhs, child_ids))
+        return parser_output if accepted else False
+
+    def parse_with_actions(self, tokens, on_reduce, on_shift=None):
+        # Single-pass semantic actions: on_shift(token) gives the value of a token (the token
+        # itself by default) and on_reduce(lhs, rhs, values) the value of a production from the
+        # values of its right-hand side. Only the values on the parse stack are kept alive.
+        # Returns (True, value of the start symbol), or (False, None) after setting self.error, so a
+        # parse whose actions only have side effects (and return None) still tells success from failure.
+        accepted, value = self.drive(tokens, on_shift or (lambda token: token), on_reduce)
+        return (True, value) if accepted else (False, None)
+
+    def iter_parse(self, tokens):
+        # Streaming (SAX-style) parse: yields (SHIFT, token), (REDUCE, lhs, rhs) and finally
+        # (ACCEPT_EVENT,) or (ERROR_EVENT, state, token) without building anything
+        tables = self.tables
+        terminal_ids = tables.terminal_ids
+        productions = self.productions
+        self.error = None
+
         stack = [0]  # Start state is always 0
-        node_stack = []
-        input_symbols = input_string.split(" ") + ['$']  # Add end marker
-        idx = 0  # Pointer to the current symbol in input_string
+        end_token = (END_MARKER, None)
+        token_iterator = iter(tokens)
+        current_token = next(token_iterator, end_token)
 
         while True:
             current_state = stack[-1]
-            current_symbol = input_symbols[idx]
-            action_key = (current_state, current_symbol)
-
-            if action_key in self.action:
-                action_tuple = self.action[action_key]
-                action = action_tuple[0]
-
-                if action == 'shift':
-                    state = action_tuple[1]
-                    stack.append(current_symbol)
-                    stack.append(state)
-                    idx += 1  # Move to the next symbol in the input string
-
-                    new_node_id = parser_output.add_node(current_symbol)
-                    node_stack.append(new_node_id)
-                elif action == 'reduce':
-                    lhs = action_tuple[1]
-                    rhs = action_tuple[2]
-                    # Pop the stack twice the length of the right-hand side of the production
-                    for _ in range(2 * len(rhs)):
-                        stack.pop()
-                    # Push the left-hand side of the production onto the stack
-                    top_state = stack[-1]
-                    stack.append(lhs)
-                    goto_state = self.goto_table[(top_state, lhs)]
-                    stack.append(goto_state)
-
-                    lhs_node_id = parser_output.add_node(lhs)
-                    for _ in range(len(rhs)):
-                        child_id = node_stack.pop()
-                        parser_output.nodes[child_id]["parent"] = lhs_node_id
-                        parser_output.nodes[lhs_node_id]["children"].insert(0, child_id)
-
-                    node_stack.append(lhs_node_id)
-                elif action == 'accept':
-                    print("The string is accepted by the grammar. \n")
-                    print("Parsing tree:")
-                    parser_output.display_tree()
-                    return parser_output.get_tree()
-                else:
-                    print(f"Invalid action: {action}")
-                    return False
+            symbol_id = terminal_ids.get(current_token[0])
+            code = ERROR if symbol_id is None else tables.action(current_state, symbol_id)
+            if code > 0:  # Shift
+                stack.append(code - 1)
+                yield SHIFT, current_token
+                current_token = next(token_iterator, end_token)
+            elif code < ACCEPT:  # Reduce
+                production = -code - 1
+                length = tables.production_lengths[production]
+                if length:
+                    del stack[-length:]
+                lhs_id = tables.production_lhs[production]
+                stack.append(tables.goto(stack[-1], lhs_id))
+                lhs, rhs = productions[production]
+                yield REDUCE, lhs, rhs
+            elif code == ACCEPT:
+                yield (ACCEPT_EVENT,)
+                return
             else:
-                print(f"No action defined for state {current_state} and symbol '{current_symbol}'.")
-                return False
-
-    def parse_tokens(self, tokens):
-        # Print the states
-        print("States:")
-        for i, state in enumerate(self.states):
-            print(f"State {i}: {[str(item) for item in state]}")
-
-        # Print the action table
-        print("\nAction Table:")
-        for key, value in sorted(self.action.items()):
-            state, symbol = key
-            print(f"State {state}, Symbol '{symbol}': {value}")
-
-        # Print the goto table
-        print("\nGoto Table:")
-        for key, value in sorted(self.goto_table.items()):
-            state, symbol = key
-            print(f"State {state}, Symbol '{symbol}': {value}")
-
-        print("Starting parsing process...")
-        print("Initial tokens:", tokens[:5])  # Log the first few tokens
+                self.error = f"No action defined for state {current_state} and symbol '{current_token[0]}'."
+                yield ERROR_EVENT, current_state, current_token
+                return
+
+    def drive(self, tokens, on_shift=None, on_reduce=None):
+        # Table-driven loop over the integer-coded tables; self.action/self.goto_table are
+        # kept for debugging only. tokens can be any iterable, e.g. Scanner.iter_tokens(),
+        # and is consumed one token at a time. When on_reduce is given, a value stack runs
+        # alongside the state stack. Returns (accepted, value of the start symbol).
+        if self.profiler is None:
+            return self.drive_loop(tokens, on_shift, on_reduce, self.trace)
+        # Shifts and reductions are only counted here, through the trace hook, to keep the loop lean
+        with self.profiler.phase('parse'):
+            return self.drive_loop(tokens, on_shift, on_reduce, self.profiler.count_events(self.trace))
+
+    def drive_loop(self, tokens, on_shift, on_reduce, trace):
+        tables = self.tables
+        terminal_ids = tables.terminal_ids
+        action_base = tables.action_base
+        action_check = tables.action_check
+        action_value = tables.action_value
+        check_size = len(action_check)
+        default_action = tables.default_action
+        goto_base = tables.goto_base
+        goto_value = tables.goto_value
+        production_lhs = tables.production_lhs
+        production_lengths = tables.production_lengths
+        symbols = tables.symbols
+        terminal_count = tables.terminal_count
+        productions = self.productions
+        self.error = None
 
-        parser_output = ParserOutput()
         stack = [0]  # Start state is always 0
-        node_stack = []
-        idx = 0  # Pointer to the current token in tokens
+        values = [] if on_reduce is not None else None
+        end_token = (END_MARKER, None)
+        token_iterator = iter(tokens)
+        current_token = next(token_iterator, end_token)
 
         while True:
             current_state = stack[-1]
-            current_token = tokens[idx]
             token_type = current_token[0]  # Use the token type for parsing
 
-            print(f"Current state: {current_state}, Current token: {current_token}")  # Logging current state and token
-
-            action_key = (current_state, token_type)
-
-            if action_key in self.action:
-                action_tuple = self.action[action_key]
-                action = action_tuple[0]
-                print(f"Action: {action}")
-
-                if action == 'shift':
-                    state = action_tuple[1]
-                    stack.append(token_type)  # Push the token type onto the stack
-                    stack.append(state)
-                    idx += 1  # Move to the next token
-
-                    new_node_id = parser_output.add_node(token_type)
-                    node_stack.append(new_node_id)
-                elif action == 'reduce':
-                    print("Reducing with: ", action_tuple)
-
-                    lhs = action_tuple[1]
-                    rhs = action_tuple[2]
-                    # Pop the stack twice the length of the right-hand side of the production
-                    for _ in range(2 * len(rhs)):
-                        stack.pop()
-
-                    # Push the left-hand side of the production onto the stack
-                    top_state = stack[-1]
-                    stack.append(lhs)
-                    goto_state = self.goto_table[(top_state, lhs)]
-                    stack.append(goto_state)
-
-                    # Create a new node for the left-hand side of the production
-                    lhs_node_id = parser_output.add_node(lhs)
-
-                    # Link all children to this new node and pop them from the node stack
-                    for _ in range(len(rhs)):
-                        child_id = node_stack.pop()
-                        parser_output.nodes[child_id]["parent"] = lhs_node_id
-                        parser_output.nodes[lhs_node_id]["children"].insert(0, child_id)
-
-                    node_stack.append(lhs_node_id)
-
-                elif action == 'accept':
-                    print("\n Parsing finished. \n")
-                    print("The string is accepted by the grammar. \n")
-                    print("Parsing tree:")
-                    parser_output.display_tree()
-                    return parser_output.get_tree()
+            symbol_id = terminal_ids.get(token_type)
+            if symbol_id is None:
+                code = ERROR
+            else:
+                index = action_base[current_state] + symbol_id
+                if index < check_size and action_check[index] == current_state:
+                    code = action_value[index]
                 else:
-                    print(f"Invalid action: {action}")
-                    return False
+                    code = default_action[current_state]
+
+            if code > 0:  # Shift
+                if trace is not None:
+                    trace(SHIFT, current_state, current_token, code - 1)
+                stack.append(code - 1)
+                if values is not None:
+                    values.append(on_shift(current_token))
+                current_token = next(token_iterator, end_token)  # Move to the next token
+            elif code < ACCEPT:  # Reduce
+                production = -code - 1
+                if trace is not None:
+                    trace(REDUCE, current_state, current_token, productions[production])
+                lhs_id = production_lhs[production]
+                length = production_lengths[production]
+                if length:
+                    del stack[-length:]
+                # Push the goto state for the left-hand side of the production
+                goto_state = goto_value[goto_base[stack[-1]] + lhs_id - terminal_count]
+                if trace is not None:
+                    trace(GOTO, stack[-1], symbols[lhs_id], goto_state)
+                stack.append(goto_state)
+
+                if values is not None:
+                    # The right-hand side values are the top of the value stack, already in order
+                    if length:
+                        rhs_values = values[-length:]
+                        del values[-length:]
+                    else:
+                        rhs_values = []
+                    lhs, rhs = productions[production]
+                    values.append(on_reduce(lhs, rhs, rhs_values))
+            elif code == ACCEPT:
+                if trace is not None:
+                    trace(ACCEPT_EVENT, current_state, current_token, None)
+                return True, (values[-1] if values else None)
             else:
-                print(f"No action defined for state {current_state} and symbol '{token_type}'.")
-                return False
+                if trace is not None:
+                    trace(ERROR_EVENT, current_state, current_token, None)
+                self.error = f"No action defined for state {current_state} and symbol '{token_type}'."
+                return False, None
+
+
+def print_trace(event, state, token, detail):
+    # A ready-made hook for LR0Parser.set_trace that logs every step
+    if event == SHIFT:
+        print(f"State {state}, token {token}: shift to state {detail}")
+    elif event == REDUCE:
+        print(f"State {state}, token {token}: reduce {detail[0]} -> {' '.join(detail[1])}")
+    elif event == GOTO:
+        print(f"State {state}: goto state {detail} on {token}")
+    elif event == ACCEPT_EVENT:
+        print(f"State {state}, token {token}: accept")
+    else:
+        print(f"State {state}, token {token}: no action defined")
 
 
 class ParserOutput:
+    # The tree is kept in parallel arrays indexed by node id instead of one dict per node
     def __init__(self):
-        self.nodes = []
+        self.symbols = []  # Interned symbol of every node
+        self.parents = array('i')  # Parent id, -1 for a root
+        self.children = []  # List of child ids, left to right
         self.node_counter = 0
+        self.node_dicts = None  # The nodes view, kept until a node is added
 
     def add_node(self, symbol, parent=None):
-        node = {
-            "id": self.node_counter,
-            "symbol": symbol,
-            "parent": parent,
-            "children": []
-        }
-        self.nodes.append(node)
+        self.symbols.append(intern(symbol))
+        self.parents.append(-1 if parent is None else parent)
+        self.children.append([])
         self.node_counter += 1
-        return node["id"]
+        return self.node_counter - 1
+
+    def add_parent(self, symbol, child_ids):
+        # New node over already built children (what a reduction does), linked in one step
+        node_id = self.add_node(symbol)
+        parents = self.parents
+        for child_id in child_ids:
+            parents[child_id] = node_id
+        self.children[node_id] = list(child_ids)
+        return node_id
+
+    @classmethod
+    def from_tuples(cls, root):
+        # A tree of (token type, value) leaves and (symbol, children) nodes, numbered children
+        # first like LR0Parser builds them
+        output = cls()
+        ids = []
+        work = [(root, False)]
+        while work:
+            node, expanded = work.pop()
+            symbol, rest = node
+            if not isinstance(rest, tuple):
+                ids.append(output.add_node(symbol))
+            elif expanded:
+                child_ids = ids[len(ids) - len(rest):]
+                del ids[len(ids) - len(rest):]
+                ids.append(output.add_parent(symbol, child_ids))
+            else:
+                work.append((node, True))
+                work.extend((child, False) for child in reversed(rest))
+        return output
 
     def add_child(self, parent_id, symbol):
         child_id = self.add_node(symbol, parent=parent_id)
-        self.nodes[parent_id]["children"].append(child_id)
+        self.children[parent_id].append(child_id)
         return child_id
 
+    def node(self, node_id):
+        parent = self.parents[node_id]
+        return {
+            "id": node_id,
+            "symbol": self.symbols[node_id],
+            "parent": None if parent < 0 else parent,
+            "children": list(self.children[node_id])
+        }
+
+    @property
+    def nodes(self):
+        # The old one-dict-per-node view, built on first use. Every change to the tree adds a node, so
+        # the view stays valid for as long as the node count does.
+        if self.node_dicts is None or len(self.node_dicts) != self.node_counter:
+            self.node_dicts = [self.node(node_id) for node_id in range(self.node_counter)]
+        return self.node_dicts
+
+    def __len__(self):
+        return self.node_counter
+
     def display_tree(self):
         print(f"{'Node':<10}{'Symbol':<10}{'Parent':<10}{'Children':<10}")
-        for node in self.nodes:
-            children = ', '.join(str(self.nodes[child]["id"]) for child in node["children"])
-            parent = node["parent"] if node["parent"] is not None else ''
-            print(f"{node['id']:<10}{node['symbol']:<10}{parent:<10}{children:<10}")
+        for node_id in range(self.node_counter):
+            children = ', '.join(str(child) for child in self.children[node_id])
+            parent = self.parents[node_id] if self.parents[node_id] >= 0 else ''
+            print(f"{node_id:<10}{self.symbols[node_id]:<10}{parent:<10}{children:<10}")
 
     def get_tree(self):
         return self.nodes
@@ -0,0 +1,210 @@
+import types
+
+from Files import atomic_write
+from GrammarAnalysis import END_MARKER
+from ParseTables import ACCEPT
+from Parser import METHODS
+
+# The parse functions of every generated module; they only use the tables written above them
+PARSE_FUNCTIONS = '''
+END_TOKEN = (END_MARKER, None)
+
+
+def recognize(tokens):
+    # Returns (True, None) if the tokens form a program, else (False, error message)
+    actions = ACTIONS
+    defaults = DEFAULTS
+    reductions = REDUCTIONS
+    terminals = TERMINALS
+    stack = [0]  # Start state is always 0
+    push = stack.append
+    state = 0
+    token_iterator = iter(tokens)
+    token_type = next(token_iterator, END_TOKEN)[0]
+    while True:
+        code = actions[state].get(token_type)
+        if code is None:
+            code = defaults[state] if token_type in terminals else 0
+        if code > 0:  # Shift
+            state = code - 1
+            push(state)
+            token_type = next(token_iterator, END_TOKEN)[0]
+        elif code < -1:  # Reduce
+            length, goto = reductions[-code - 1]
+            if length == 1:
+                state = stack[-1] = goto[stack[-2]]
+            else:
+                if length:
+                    del stack[-length:]
+                state = goto[stack[-1]]
+                push(state)
+        elif code == -1:
+            return True, None
+        else:
+            return False, f"No action defined for state {state} and symbol '{token_type}'."
+
+
+def parse(tokens, on_shift=None, on_reduce=None):
+    # Same as recognize, with a value for every symbol: on_shift(token) for tokens (the token itself
+    # by default) and on_reduce(lhs, rhs, values) for productions (by default (lhs, values) tuples,
+    # i.e. the parse tree). Returns (True, value of the start symbol) or (False, error message).
+    actions = ACTIONS
+    defaults = DEFAULTS
+    reductions = REDUCTIONS
+    productions = PRODUCTIONS
+    terminals = TERMINALS
+    stack = [0]
+    push = stack.append
+    values = []
+    push_value = values.append
+    state = 0
+    token_iterator = iter(tokens)
+    token = next(token_iterator, END_TOKEN)
+    token_type = token[0]
+    while True:
+        code = actions[state].get(token_type)
+        if code is None:
+            code = defaults[state] if token_type in terminals else 0
+        if code > 0:
+            state = code - 1
+            push(state)
+            push_value(token if on_shift is None else on_shift(token))
+            token = next(token_iterator, END_TOKEN)
+            token_type = token[0]
+        elif code < -1:
+            production = -code - 1
+            length, goto = reductions[production]
+            lhs, rhs = productions[production]
+            if length == 1:
+                state = stack[-1] = goto[stack[-2]]
+                values[-1] = (lhs, (values[-1],)) if on_reduce is None else on_reduce(lhs, rhs, values[-1:])
+            else:
+                if length:
+                    del stack[-length:]
+                    rhs_values = values[-length:]
+                    del values[-length:]
+                else:
+                    rhs_values = []
+                state = goto[stack[-1]]
+                push(state)
+                push_value((lhs, tuple(rhs_values)) if on_reduce is None else on_reduce(lhs, rhs, rhs_values))
+        elif code == -1:
+            return True, values[-1]
+        else:
+            return False, f"No action defined for state {state} and symbol '{token_type}'."
+'''
+
+
+def generate(parser, source_name=None):
+    # Source of a standalone module with the parser's tables as constants and parse functions
+    # specialized to them. Actions use the ParseTables codes, keyed by token type per state; the
+    # state's default reduction is taken for any other terminal. Every production carries its
+    # length and the goto column of its left-hand side, so a reduction is two lookups.
+    tables = parser.tables
+    nonterminals = list(parser.grammar)
+    terminal_order = {symbol: i for i, symbol in enumerate(tables.symbols)}
+
+    rows = [{} for _ in parser.states]
+    for (state, symbol), value in parser.action.items():
+        code = tables.encode(parser, value)
+        if code != tables.default_action[state]:
+            rows[state][symbol] = code
+    columns = {nonterminal: {} for nonterminal in nonterminals}
+    for (state, symbol), target in parser.goto_table.items():
+        columns[symbol][state] = target
+    terminals = tables.symbols[:tables.terminal_count]
+
+    lines = [
+        f"# Generated by ParserGenerator{f' from {source_name}' if source_name else ''}. Do not edit.",
+        f"# {METHODS[parser.method]} parser, {len(parser.states)} states, {len(parser.productions)} productions.",
+    ]
+    if parser.conflicts:
+        lines.append(f"# {len(parser.conflicts)} conflict(s) were resolved in favour of the first action.")
+    lines += [
+        "",
+        f"FINGERPRINT = {parser.fingerprint!r}",
+        f"METHOD = {parser.method!r}",
+        f"START = {parser.start_symbol!r}",
+        f"END_MARKER = {END_MARKER!r}",
+        "",
+        "# Every terminal the tables know; other token types are syntax errors",
+        "TERMINALS = frozenset((",
+        *wrap([repr(symbol) for symbol in terminals]),
+        "))",
+        "",
+        "# (lhs, rhs) by production number",
+        "PRODUCTIONS = (",
+    ]
+    lines += [f"    ({lhs!r}, {tuple(rhs)!r})," for lhs, rhs in parser.productions]
+    lines += [
+        ")",
+        "",
+        f"# Action codes per state and token type: n > 0 shifts to state n - 1, n < {ACCEPT} reduces by production",
+        f"# -n - 1 and {ACCEPT} accepts",
+        "ACTIONS = (",
+    ]
+    for state, row in enumerate(rows):
+        items = [f"{symbol!r}: {code}" for symbol, code in sorted(row.items(), key=lambda item: terminal_order[item[0]])]
+        lines += dict_lines(items, state)
+    lines += [
+        ")",
+        "",
+        "# Action for terminals missing from a state's row: its most common reduction, or 0 (error)",
+        "DEFAULTS = (",
+        *wrap([str(code) for code in tables.default_action]),
+        ")",
+        "",
+        "# Goto targets of every nonterminal, by the state a reduction uncovers",
+        "GOTOS = (",
+    ]
+    for nonterminal in nonterminals:
+        items = [f"{state}: {target}" for state, target in sorted(columns[nonterminal].items())]
+        lines += dict_lines(items, nonterminal)
+    lines += [
+        ")",
+        "",
+        "# (right-hand side length, goto column of the left-hand side) by production number",
+        "REDUCTIONS = (",
+    ]
+    goto_ids = {nonterminal: i for i, nonterminal in enumerate(nonterminals)}
+    lines += [f"    ({len(rhs)}, GOTOS[{goto_ids[lhs]}])," for lhs, rhs in parser.productions]
+    lines.append(")")
+    return '\n'.join(lines) + '\n' + PARSE_FUNCTIONS
+
+
+def wrap(items, indent=4, width=116):
+    # Comma-separated items over as many lines as it takes to stay within width
+    lines = []
+    line = ''
+    for item in items:
+        if line and indent + len(line) + len(item) + 1 > width:
+            lines.append(' ' * indent + line.rstrip())
+            line = ''
+        line += item + ', '
+    if line:
+        lines.append(' ' * indent + line.rstrip())
+    return lines
+
+
+def dict_lines(items, comment):
+    # A dict literal inside a tuple, on one line if it fits
+    line = f"    {{{', '.join(items)}}},  # {comment}"
+    if len(line) <= 120:
+        return [line]
+    return [f"    {{  # {comment}", *wrap(items, 8), "    },"]
+
+
+def write_parser(parser, output_file, source_name=None):
+    # Written with atomic_write, so an import never sees half a module
+    source = generate(parser, source_name)
+    return atomic_write(output_file, lambda file: file.write(source), binary=False)
+
+
+def load_generated(source, name='generated_parser'):
+    # Turns generated source into a module without writing it anywhere (the module is not added to
+    # sys.modules)
+    module = types.ModuleType(name)
+    module.__file__ = f"<{name}>"
+    exec(compile(source, module.__file__, 'exec'), module.__dict__)
+    return module
+
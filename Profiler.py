@@ -0,0 +1,98 @@
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+# LR0Parser trace events and the counters they are tallied under
+EVENT_COUNTERS = {'shift': 'shifts', 'reduce': 'reductions'}
+
+
+class Profiler:
+    # Wall time per named phase, plus plain counters. Phases may nest (parsing pulls tokens from the
+    # scanner, so scanning happens inside the parse phase); self time leaves nested phases out.
+    # With memory set, the net change in memory traced by tracemalloc is recorded per phase too.
+    # With events set, every shift and reduction is counted through the parser's trace hook.
+    # Both slow the compile down, so turn them off for timings that are comparable to a normal run.
+    def __init__(self, memory=True, events=True):
+        self.memory = memory
+        self.events = events
+        self.phases = {}
+        self.counters = {}
+        self.nested = []  # Seconds spent in nested phases, per open phase
+        self.started = time.perf_counter()
+        self.tracing = False
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.tracing = True  # Stopped again by stop()
+
+    @contextmanager
+    def phase(self, name):
+        memory_before = tracemalloc.get_traced_memory()[0] if self.memory else 0
+        self.nested.append(0.0)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            memory_delta = tracemalloc.get_traced_memory()[0] - memory_before if self.memory else 0
+            self.record(name, seconds, self.nested.pop(), memory_delta)
+
+    def record(self, name, seconds, nested=0.0, memory_delta=0, calls=1):
+        # For hot spots timed by hand instead of with phase()
+        if self.nested:
+            self.nested[-1] += seconds
+        entry = self.phases.get(name)
+        if entry is None:
+            entry = self.phases[name] = {'calls': 0, 'seconds': 0.0, 'self_seconds': 0.0, 'memory_delta': 0}
+        entry['calls'] += calls
+        entry['seconds'] += seconds
+        entry['self_seconds'] += seconds - nested
+        entry['memory_delta'] += memory_delta
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def count_events(self, trace=None):
+        # A trace hook for LR0Parser that counts events and passes them on to trace
+        if not self.events:
+            return trace
+        counters = self.counters
+        names = EVENT_COUNTERS
+
+        def hook(event, state, token, detail):
+            name = names.get(event)
+            if name is not None:
+                counters[name] = counters.get(name, 0) + 1
+            if trace is not None:
+                trace(event, state, token, detail)
+
+        return hook
+
+    def stop(self):
+        if self.tracing:
+            tracemalloc.stop()
+            self.tracing = False
+
+    def report(self):
+        report = {
+            'seconds': time.perf_counter() - self.started,
+            'memory_tracked': self.memory,
+            'phases': {name: dict(entry) for name, entry in self.phases.items()},
+            'counters': dict(self.counters),
+        }
+        if self.memory and tracemalloc.is_tracing():
+            report['peak_memory'] = tracemalloc.get_traced_memory()[1]
+        return report
+
+    def merge(self, report):
+        # Adds the phases and counters of another profiler's report, e.g. one from a worker process
+        for name, entry in report['phases'].items():
+            totals = self.phases.setdefault(name, {'calls': 0, 'seconds': 0.0, 'self_seconds': 0.0, 'memory_delta': 0})
+            for key in totals:
+                totals[key] += entry[key]
+        for name, amount in report['counters'].items():
+            self.count(name, amount)
+
+    def write(self, report_file):
+        with open(report_file, 'w') as file:
+            json.dump(self.report(), file, indent=2)
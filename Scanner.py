@@ -1,70 +1,159 @@
-from FiniteAutomation import FiniteAutomation
+import codecs
+import mmap
+import os
+import time
+from contextlib import nullcontext
+
+from BinaryFormat import write_binary
+from BulkLexer import BulkLexer
 from HashTable import HashTable
-import re
+from Lexer import CONSTANT, IDENTIFIER, RESERVED, load_lexer
+
+CHUNK_SIZE = 1 << 22  # Bytes of source lexed per step when scanning memory-mapped files
 
 
 class Scanner:
-    def __init__(self, token_file):
+    def __init__(self, token_file, lexer=None, verbose=True, profiler=None, bulk=False):
         self.symbol_table = HashTable()
         self.pif = []
         self.tokens = []
+        self.correct = True
+        self.errors = []
+        self.verbose = verbose
+        self.profiler = profiler
 
         with open(token_file, 'r') as file:
             for line in file:
                 line = line.strip()
                 if line:
                     self.tokens.append(line)
+        # Keywords, operators and both automata compiled into a single DFA, built once per process
+        if lexer is None:
+            with self.phase('load_automata'):
+                lexer = load_lexer(token_file)
+        self.lexer = lexer
+        # The bulk lexer gives the same tokens with NumPy doing the per-character work (ImportError without it)
+        self.scan_chunk = BulkLexer(lexer).scan_chunk if bulk else lexer.scan_chunk
+
+    def phase(self, name):
+        return self.profiler.phase(name) if self.profiler is not None else nullcontext()
+
+    def reset(self):
+        # Fresh symbol table and PIF for the next source file; the lexer is kept
+        self.symbol_table = HashTable()
+        self.pif = []
+        self.correct = True
+        self.errors = []
 
     def scan(self, src_file):
-        fa_nc = FiniteAutomation("fa_numeric-const.in")
-        fa_id = FiniteAutomation("fa_identifier.in")
+        for _ in self.iter_tokens(src_file, record_pif=True):
+            pass
+
+    def iter_tokens(self, src_file, record_pif=False, chunk_size=CHUNK_SIZE):
+        # Yields (token type, value) pairs as the source is read: identifiers and constants carry
+        # their text, every other token carries None. The PIF is only kept when record_pif is set.
+        # The file is memory-mapped and lexed chunk_size bytes at a time; a token cut by a chunk
+        # boundary is carried over into the next chunk.
+        return self.iter_chunk_tokens(self.iter_chunks(src_file, chunk_size), record_pif)
+
+    def iter_text_tokens(self, text, record_pif=False):
+        # Same as iter_tokens for source text that is already in memory
+        return self.iter_chunk_tokens(self.text_chunks(text), record_pif)
+
+    def iter_chunk_tokens(self, chunks, record_pif=False):
         correct = True
-        with open(src_file, 'r') as file:
-            line_idx = 0
-            for line in file:
-                line_idx += 1
-                line = re.sub('//.*$', '', line).strip()  # Remove comments
-                if line:
-                    # Splitting by tokens while considering the logical operators and array indexing
-                    tokens = re.findall(r'"[^"]*"|[^\s\(\)\[\]{};:=,<>+!\-*\/%]+|\S', line)
-                    for token in tokens:
-                        if token in self.tokens:
-                            self.pif.append((token, -1))
-                        elif fa_id.is_accept(token):
-                            # Identifiers
-                            if not self.symbol_table.contains(token):
-                                self.symbol_table.add(token)
-                            idx = self.symbol_table.get_position(token)
-                            self.pif.append(('identifier', idx))
-                            self.symbol_table.add(token)
-                        elif fa_nc.is_accept(token) or re.match(r'^".*"$', token):
-                            # Numeric and string constants
-                            if not self.symbol_table.contains(token):
-                                self.symbol_table.add(token)
-                            idx = self.symbol_table.get_position(token)
-                            self.pif.append(('constant', idx))
-                            self.symbol_table.add(token)
-                        elif token in {'or', 'and', 'not'}:
-                            self.pif.append((token, -1))
-                        else:
-                            print(f"lexical error: invalid token {token} on line {line_idx}.")
-                            correct = False
-        print("lexically correct") if correct else ""
+        add = self.symbol_table.add if self.profiler is None else self.profiled_add
+        token_count = 0
+        error_count = len(self.errors)
+        symbol_count = len(self.symbol_table)
+        resizes = self.symbol_table.resizes
+        collisions = self.symbol_table.collisions
+        line_idx = 1
+        line_start = 0  # Offset of the current line in text (negative if it began in an earlier chunk)
+        counted = 0  # Newlines in text before this offset are already included in line_idx
+        for text, consumed, tokens in chunks:
+            token_count += len(tokens)
+            for token_class, token, offset in tokens:
+                if token_class == RESERVED:
+                    if record_pif:
+                        self.pif.append((token, -1))
+                    yield token, None
+                elif token_class == IDENTIFIER or token_class == CONSTANT:
+                    symbol_id = add(token)  # Interns the symbol and returns its unique id
+                    if record_pif:
+                        self.pif.append((token_class, symbol_id))
+                    yield token_class, token
+                else:
+                    newlines = text.count('\n', counted, offset)
+                    if newlines:
+                        line_idx += newlines
+                        line_start = text.rfind('\n', counted, offset) + 1
+                    counted = offset
+                    self.errors.append(
+                        f"lexical error: invalid token {token} on line {line_idx}, column {offset - line_start + 1}.")
+                    if self.verbose:
+                        print(self.errors[-1])
+                    correct = False
+            newlines = text.count('\n', counted, consumed)
+            if newlines:
+                line_idx += newlines
+                line_start = text.rfind('\n', counted, consumed) + 1
+            line_start -= consumed
+            counted = 0
+        self.correct = correct
+        if self.profiler is not None:
+            self.profiler.count('tokens', token_count)
+            self.profiler.count('lexical_errors', len(self.errors) - error_count)
+            self.profiler.count('symbols', len(self.symbol_table) - symbol_count)
+            self.profiler.count('symbol_table_resizes', self.symbol_table.resizes - resizes)
+            self.profiler.count('symbol_table_collisions', self.symbol_table.collisions - collisions)
+        if self.verbose and correct:
+            print("lexically correct")
+
+    def profiled_add(self, symbol):
+        # symbol_table.add, timed one call at a time (only while profiling)
+        start = time.perf_counter()
+        symbol_id = self.symbol_table.add(symbol)
+        self.profiler.record('symbol_table', time.perf_counter() - start)
+        return symbol_id
+
+    def iter_chunks(self, src_file, chunk_size=CHUNK_SIZE):
+        # Yields (text, consumed, tokens) per chunk, where text starts with whatever the previous
+        # chunk left unconsumed
+        with open(src_file, 'rb') as file:
+            size = os.fstat(file.fileno()).st_size
+            if size == 0:
+                return
+            decoder = codecs.getincrementaldecoder('utf-8')()
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                carry = ''
+                for offset in range(0, size, chunk_size):
+                    final = offset + chunk_size >= size
+                    text = carry + decoder.decode(mapped[offset:offset + chunk_size], final)
+                    with self.phase('scan'):
+                        tokens, consumed = self.scan_chunk(text, 0, final)
+                    yield text, consumed, tokens
+                    carry = text[consumed:]
+
+    def text_chunks(self, text):
+        # The whole text as the only chunk, in the form iter_chunks yields
+        with self.phase('scan'):
+            tokens, consumed = self.scan_chunk(text, 0, True)
+        yield text, consumed, tokens
 
     def write_to_files(self, symbol_file, pif_file):
+        # Line i holds the symbol with id i, which is what the PIF positions refer to
         with open(symbol_file, 'w') as file:
-            file.write('')
-            for bucket in self.symbol_table.table:
-                if bucket is not None:
-                    for value in bucket:
-                        file.write(str(value) + ' ')
-                    file.write('\n')
-                else:
-                    file.write('-\n')
+            for symbol in self.symbol_table.symbols:
+                file.write(('-' if symbol is None else str(symbol)) + '\n')
         with open(pif_file, 'w') as file:
             file.write('')
             for pair in self.pif:
                 file.write(str(pair) + '\n')
 
+    def write_binary(self, path):
+        # Both in one file that BinaryFormat.BinaryPIF maps without parsing anything
+        return write_binary(path, self.pif, self.symbol_table.symbols)
+
     def __str__(self):
         return str(self.pif) + '\n' + str(self.symbol_table)
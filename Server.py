@@ -0,0 +1,148 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+import socket
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+
+import Batch
+
+# Requests and responses are JSON objects, one per line. A request is
+#   {"op": "compile", "path": FILE} or {"op": "compile", "source": TEXT}, optionally with "tokens": true
+#       and "tree": true; "op" defaults to "compile"
+#   {"op": "ping"}
+# and may carry an "id" that the response repeats. A compile response has "accepted", "lexically_correct"
+# and "errors" (see Batch.compile_request); a request the server cannot run gets {"error": message}.
+MAX_REQUEST = 64 << 20  # Longest request line in bytes
+
+
+class CompileServer:
+    # Loads the lexer and the parsing tables once and compiles on a pool of worker processes that
+    # start with both loaded (forked after loading where possible), so a request only pays for its
+    # own input. With workers=0 requests are compiled in this process instead, one at a time, on a
+    # thread that keeps the event loop free. At most max_pending requests are handed to the pool at
+    # a time; the others wait for a free place instead of piling up in the pool's queue.
+    def __init__(self, grammar_file="grammar.in", token_file="token.in", workers=None, method='lalr',
+                 cache_file=None, optimize=False, max_pending=None, bulk=False):
+        Batch.init_worker(token_file, grammar_file, cache_file, method, optimize=optimize, bulk=bulk)
+        if workers == 0:
+            self.executor = ThreadPoolExecutor(1)
+        else:
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+            self.executor = ProcessPoolExecutor(workers, mp_context=context, initializer=Batch.init_worker,
+                                                initargs=(token_file, grammar_file, cache_file, method, None, optimize,
+                                                          bulk))
+        self.workers = workers if workers is not None else os.cpu_count() or 1
+        self.max_pending = max_pending or 2 * max(self.workers, 1)
+        self.pending = None  # Semaphore of the running event loop, created by serve()
+        self.requests = 0
+
+    async def serve(self, socket_path=None, host='127.0.0.1', port=0, ready=None):
+        # Serves on the Unix socket at socket_path, else on host:port, until cancelled or sent SIGTERM.
+        # ready(address) is called once the server is listening (with the port picked when port is 0).
+        self.pending = asyncio.Semaphore(self.max_pending)
+        if socket_path is not None:
+            server = await asyncio.start_unix_server(self.handle, socket_path, limit=MAX_REQUEST)
+        else:
+            server = await asyncio.start_server(self.handle, host, port, limit=MAX_REQUEST)
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+        except (AttributeError, NotImplementedError, RuntimeError):
+            # No SIGTERM, no signal handlers in the loop (Windows) or not on the main thread
+            pass
+        async with server:
+            if ready is not None:
+                ready(socket_path if socket_path is not None else server.sockets[0].getsockname()[:2])
+            try:
+                await server.serve_forever()
+            except asyncio.CancelledError:
+                pass
+
+    async def handle(self, reader, writer):
+        # Requests on one connection are answered in order; open several connections to have them
+        # compiled in parallel
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:  # Longer than MAX_REQUEST; the rest of the stream cannot be framed
+                    writer.write(b'{"error": "request too long"}\n')
+                    break
+                if not line:
+                    break
+                response = await self.respond(line)
+                writer.write(json.dumps(response).encode('utf-8') + b'\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, line):
+        try:
+            request = json.loads(line)
+        except ValueError:
+            return {'error': "invalid JSON"}
+        if not isinstance(request, dict):
+            return {'error': "a request must be a JSON object"}
+        response = {'id': request['id']} if 'id' in request else {}
+        operation = request.get('op', 'compile')
+        if operation == 'ping':
+            response.update(ok=True, requests=self.requests, workers=self.workers)
+        elif operation == 'compile':
+            path = request.get('path')
+            source = request.get('source')
+            if not isinstance(path if source is None else source, str) or (path is None) == (source is None):
+                response['error'] = "a compile request needs either a 'path' or a 'source' string"
+            else:
+                compile_request = partial(Batch.compile_request, path, source, bool(request.get('tokens')),
+                                          bool(request.get('tree')))
+                try:
+                    async with self.pending:
+                        result = await asyncio.get_running_loop().run_in_executor(self.executor, compile_request)
+                except Exception as error:  # The request failed in the worker, or the pool is broken
+                    response['error'] = f"compile failed: {type(error).__name__}: {error}"
+                else:
+                    response.update(result)
+        else:
+            response['error'] = f"unknown op '{operation}'"
+        self.requests += 1
+        return response
+
+    def close(self):
+        self.executor.shutdown(cancel_futures=True)
+
+
+def run_server(server, socket_path=None, host='127.0.0.1', port=0, ready=None):
+    # Runs until interrupted, then stops the workers and removes the socket file
+    try:
+        asyncio.run(server.serve(socket_path, host, port, ready))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        if socket_path is not None and os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+def send_requests(requests, socket_path=None, host='127.0.0.1', port=None):
+    # Blocking client for scripts and tests: sends the requests over one connection, each after the
+    # previous response, and returns the responses
+    if socket_path is not None:
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.connect(socket_path)
+    else:
+        connection = socket.create_connection((host, port))
+    responses = []
+    with connection, connection.makefile('rwb') as stream:
+        for request in requests:
+            stream.write(json.dumps(request).encode('utf-8') + b'\n')
+            stream.flush()
+            line = stream.readline()
+            if not line:
+                raise ConnectionError("the server closed the connection")
+            responses.append(json.loads(line))
+    return responses
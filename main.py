@@ -1,34 +1,352 @@
-from Scanner import Scanner
-from Grammar import FormalGrammar
-from Parser import *
+import argparse
+import os
+import sys
+from contextlib import nullcontext, redirect_stdout
+from io import StringIO
 
+# Subsystems are imported by the commands that use them, so every command only pays for what it needs
 
-def simple_test():
-    gr_simple = FormalGrammar("grammar_g4g.in")
-    print(gr_simple)
 
-    parser_simple = LR0Parser(gr_simple.productions, gr_simple.start, gr_simple.terminals)
-    parser_simple.parse_string("a a b b")
+def report(parser, tree):
+    if tree:
+        print("The string is accepted by the grammar. \n")
+        print("Parsing tree:")
+        tree.display_tree()
+    else:
+        print(parser.error)
 
 
-def complex_test():
-    scanner = Scanner('token.in')
-    scanner.scan('p0.txt')
-    scanner.write_to_files('st.out', 'pif.out')
+def scanner_for(options, profiler=None, verbose=False):
+    from Lexer import load_lexer
+    from Scanner import Scanner
 
-    gr = FormalGrammar("grammar.in")
-    print(gr)
+    cache_file = None if options.no_cache else options.tokens + '.cache'
+    try:
+        with profiler.phase('load_automata') if profiler is not None else nullcontext():
+            lexer = load_lexer(options.tokens, cache_file=cache_file)
+    except OSError as error:
+        sys.exit(f"cannot read {error.filename}: {error.strerror}")
+    try:
+        return Scanner(options.tokens, lexer=lexer, verbose=verbose, profiler=profiler, bulk=options.bulk)
+    except (ImportError, ValueError) as error:
+        sys.exit(f"--bulk: {error}")
 
-    parser = LR0Parser(gr.productions, gr.start, gr.terminals)
 
-    scanner_tokens = read_scanner_output('pif.out')
-    symbol_table = read_symbol_table('st.out')
+def parser_for(options, profiler=None):
+    from Parser import load_parser
 
-    converted_tokens = convert_tokens(scanner_tokens, symbol_table)
+    cache_file = None if options.no_cache else options.grammar + '.cache'
+    try:
+        return load_parser(options.grammar, cache_file, options.method, profiler, options.optimize)
+    except OSError as error:
+        sys.exit(f"cannot read {error.filename}: {error.strerror}")
 
-    parser.parse_tokens(converted_tokens)
+
+def scan_command(options, profiler):
+    scanner = scanner_for(options, profiler, verbose=True)
+    try:
+        for _ in source_tokens(scanner, options.file, record_pif=True):
+            pass
+    except InputError as error:
+        print(error)
+        return 1
+    if options.write:
+        scanner.write_to_files(options.st, options.pif)
+    if options.binary and not scanner.write_binary(options.binary):
+        print(f"cannot write {options.binary}")
+        return 1
+    return 0 if scanner.correct else 1
+
+
+class InputError(Exception):
+    # A source or PIF file that cannot be read. Only raised around the reading itself, so that an
+    # error writing the results (e.g. to a closed pipe) is not reported as one.
+    pass
+
+
+def read_input(items, path):
+    try:
+        yield from items
+    except OSError as error:
+        raise InputError(f"cannot read {path}: {error.strerror}") from None
+    except UnicodeDecodeError:
+        raise InputError(f"cannot decode {path} as UTF-8") from None
+    except ValueError as error:  # Not a binary PIF file
+        raise InputError(f"cannot read {path}: {error}") from None
+
+
+def source_tokens(scanner, path, record_pif=False):
+    # scanner.iter_tokens(path), with the errors reading the file raised as InputError
+    return scanner.iter_chunk_tokens(read_input(scanner.iter_chunks(path), path), record_pif)
+
+
+def pif_tokens(path):
+    from BinaryFormat import BinaryPIF
+
+    with BinaryPIF(path) as pif:
+        yield from pif.tokens()
+
+
+def read_tokens(path, scanner):
+    # The tokens of a source file, or with no scanner (the --pif option) of a file written by scan --binary
+    if scanner is not None:
+        return source_tokens(scanner, path)
+    return read_input(pif_tokens(path), path)
+
+
+def parse_command(options, profiler):
+    from Parser import print_trace
+
+    parser = parser_for(options, profiler)
+    scanner = None if options.pif else scanner_for(options, profiler, verbose=True)
+    if options.tables:
+        parser.dump_tables()
+    if options.trace:
+        parser.set_trace(print_trace)
+    try:
+        tokens = read_tokens(options.file, scanner)
+        if options.glr:
+            accepted = glr_parse(parser, tokens, options.tree)
+        elif options.tree:
+            accepted = parser.parse_tokens(tokens)
+            report(parser, accepted)
+        else:
+            accepted = parser.recognize(tokens)
+            print("The string is accepted by the grammar." if accepted else parser.error)
+        for _ in tokens:  # Finish scanning after a syntax error so every lexical error is reported
+            pass
+    except InputError as error:
+        print(error)
+        return 1
+    finally:
+        parser.set_trace(None)
+    return 0 if accepted and (scanner is None or scanner.correct) else 1
+
+
+def glr_parse(parser, tokens, show_tree=False):
+    # Conflicts in the tables are explored instead of resolved; the tree shown is the first of the forest
+    from GLRParser import GLRParser, count_trees, first_tree
+    from Parser import ParserOutput
+
+    glr_parser = GLRParser(parser)
+    root = glr_parser.parse_tokens(tokens)
+    if not root:
+        print(glr_parser.error)
+        return False
+    print(f"The string is accepted by the grammar ({count_trees(root)} parse tree(s)).")
+    if show_tree:
+        print("Parsing tree:")
+        ParserOutput.from_tuples(first_tree(root)).display_tree()
+    return True
+
+
+def check_command(options, profiler):
+    # Same checks as batch, in this process: nothing is started up beyond the lexer and the tables
+    parser = parser_for(options, profiler)
+    scanner = None if options.pif else scanner_for(options, profiler)
+    failed = 0
+    for path in options.files:
+        if scanner is not None:
+            scanner.reset()
+        try:
+            tokens = read_tokens(path, scanner)
+            accepted = parser.recognize(tokens)
+            for _ in tokens:
+                pass
+        except InputError as error:
+            errors = [str(error)]
+        else:
+            errors = [] if scanner is None else list(scanner.errors)
+            if not accepted:
+                errors.append(f"syntax error: {parser.error}")
+        print_result(path, errors, options.quiet)
+        failed += bool(errors)
+    return 1 if failed else 0
+
+
+def batch_command(options, profiler):
+    from Batch import compile_batch
+
+    # Warms up the per-process caches, so the pool is forked with the lexer and the tables loaded
+    scanner_for(options)
+    cache_file = None if options.no_cache else options.grammar + '.cache'
+    results, symbol_table = compile_batch(options.files, options.grammar, options.tokens, options.processes,
+                                          options.method, cache_file, options.chunksize, profiler,
+                                          options.optimize, options.bulk)
+    failed = 0
+    for result in results:
+        print_result(result.path, result.errors, options.quiet)
+        failed += not result.accepted
+    if options.st:
+        with open(options.st, 'w') as file:
+            for symbol in symbol_table.symbols:
+                file.write(str(symbol) + '\n')
+    return 1 if failed else 0
+
+
+def generate_command(options, profiler):
+    from ParserGenerator import write_parser
+
+    parser = parser_for(options, profiler)
+    if not write_parser(parser, options.output, os.path.basename(options.grammar)):
+        print(f"cannot write {options.output}")
+        return 1
+    return 0
+
+
+def analyze_command(options, profiler):
+    # Tables are built from scratch for both grammars, so the counts compare like with like
+    from Grammar import FormalGrammar
+    from Parser import LR0Parser
+
+    grammar = FormalGrammar(options.grammar)
+    if not grammar.is_cfg():
+        return 1
+    unused = grammar.unused_symbols()
+    if unused:
+        print(f"declared but never used: {' '.join(unused)}")
+    if options.sets:
+        nullable, first, follow = grammar.analyze()
+        for symbol in grammar.productions:
+            print(f"{symbol}{' (nullable)' if symbol in nullable else ''}")
+            print(f"\tFIRST:  {' '.join(sorted(first[symbol]))}")
+            print(f"\tFOLLOW: {' '.join(sorted(follow[symbol]))}")
+    try:
+        optimized = grammar.optimized()
+    except ValueError as error:
+        print(error)
+        return 1
+    for change, symbols in optimized.changes.items():
+        if symbols:
+            print(f"{change}: {' '.join(symbols)}")
+    counts = []
+    for version in (grammar, optimized):
+        with redirect_stdout(StringIO()):  # The conflicts are counted below instead
+            parser = LR0Parser(version.productions, version.start, version.terminals, method=options.method)
+        counts.append((len(parser.productions) - 1, len(parser.states), len(parser.conflicts)))
+    for name, before, after in zip(('productions', 'states', 'conflicts'), *counts):
+        print(f"{name}: {before} -> {after}")
+    return 0
+
+
+def serve_command(options, profiler):
+    from Server import CompileServer, run_server
+
+    scanner_for(options)  # Builds (or loads) the lexer through its cache file before any worker starts
+    cache_file = None if options.no_cache else options.grammar + '.cache'
+    server = CompileServer(options.grammar, options.tokens, options.workers, options.method, cache_file,
+                           options.optimize, options.max_pending, options.bulk)
+    run_server(server, options.socket, options.host, options.port,
+               lambda address: print(f"serving on {address}", flush=True))
+    return 0
+
+
+def export_command(options, profiler):
+    from BinaryFormat import BinaryPIF
+
+    try:
+        with BinaryPIF(options.file) as pif:
+            pif.export_text(options.st, options.pif)
+    except OSError as error:
+        print(f"cannot convert {options.file}: {error.strerror}")
+        return 1
+    except ValueError as error:
+        print(f"{options.file}: {error}")
+        return 1
+    return 0
+
+
+def print_result(path, errors, quiet=False):
+    if errors:
+        for error in errors:
+            print(f"{path}: {error}")
+    elif not quiet:
+        print(f"{path}: ok")
+
+
+def main(arguments=None):
+    argument_parser = argparse.ArgumentParser(description="Scans and parses toy language programs.")
+    argument_parser.add_argument('--tokens', default="token.in", help="reserved words and operators")
+    argument_parser.add_argument('--grammar', default="grammar.in")
+    argument_parser.add_argument('--method', choices=('lr0', 'slr', 'lalr'), default='lalr')
+    argument_parser.add_argument('--no-cache', action='store_true',
+                                 help="build the lexer and the tables instead of loading them from cache files")
+    argument_parser.add_argument('--profile', metavar='FILE', help="write a JSON report of the time spent per phase")
+    argument_parser.add_argument('--optimize', action='store_true',
+                                 help="parse with the optimized grammar (smaller tables, parse trees without the "
+                                      "inlined nonterminals)")
+    argument_parser.add_argument('--bulk', action='store_true',
+                                 help="scan with the NumPy bulk lexer (same tokens, faster on large files)")
+    commands = argument_parser.add_subparsers(dest='command', required=True)
+
+    scan = commands.add_parser('scan', help="scan a file and report lexical errors")
+    scan.add_argument('file')
+    scan.add_argument('--write', action='store_true', help="write the symbol table and the PIF")
+    scan.add_argument('--st', default="st.out", metavar='FILE')
+    scan.add_argument('--pif', default="pif.out", metavar='FILE')
+    scan.add_argument('--binary', metavar='FILE',
+                      help="also write the PIF and the symbol table to one binary file, for parse --pif")
+    scan.set_defaults(handler=scan_command)
+
+    parse = commands.add_parser('parse', help="scan and parse a file")
+    parse.add_argument('file')
+    parse.add_argument('--tree', action='store_true', help="build and print the parse tree")
+    parse.add_argument('--trace', action='store_true', help="print every parser step")
+    parse.add_argument('--tables', action='store_true', help="print the parsing tables")
+    parse.add_argument('--glr', action='store_true', help="follow every action where the tables have conflicts")
+    parse.add_argument('--pif', action='store_true', help="the file is a binary PIF written by scan --binary")
+    parse.set_defaults(handler=parse_command)
+
+    check = commands.add_parser('check', help="scan and parse files one after the other")
+    check.add_argument('files', nargs='+', metavar='file')
+    check.add_argument('-q', '--quiet', action='store_true', help="only report files with errors")
+    check.add_argument('--pif', action='store_true', help="the files are binary PIFs written by scan --binary")
+    check.set_defaults(handler=check_command)
+
+    batch = commands.add_parser('batch', help="scan and parse files on a process pool")
+    batch.add_argument('files', nargs='+', metavar='file')
+    batch.add_argument('-q', '--quiet', action='store_true', help="only report files with errors")
+    batch.add_argument('--processes', type=int, help="worker processes (default: one per CPU)")
+    batch.add_argument('--chunksize', type=int, default=8, help="files sent to a worker at a time")
+    batch.add_argument('--st', metavar='FILE', help="write the merged symbol table")
+    batch.set_defaults(handler=batch_command)
+
+    generate = commands.add_parser('generate', help="write a standalone parser module with the tables built in")
+    generate.add_argument('output', help="the module to write, e.g. toy_parser.py")
+    generate.set_defaults(handler=generate_command)
+
+    serve = commands.add_parser('serve', help="keep the lexer and the tables loaded and compile requests sent as "
+                                              "JSON lines over a socket")
+    serve.add_argument('--socket', metavar='PATH', help="listen on a Unix socket instead of TCP")
+    serve.add_argument('--host', default='127.0.0.1')
+    serve.add_argument('--port', type=int, default=0, help="TCP port (default: any free one)")
+    serve.add_argument('--workers', type=int,
+                       help="worker processes (default: one per CPU; 0 compiles in the server process)")
+    serve.add_argument('--max-pending', type=int, help="requests handed to the workers at a time")
+    serve.set_defaults(handler=serve_command)
+
+    export = commands.add_parser('export', help="convert a binary PIF to the text symbol table and PIF files")
+    export.add_argument('file')
+    export.add_argument('--st', default="st.out", metavar='FILE')
+    export.add_argument('--pif', default="pif.out", metavar='FILE')
+    export.set_defaults(handler=export_command)
+
+    analyze = commands.add_parser('analyze', help="check the grammar and report what optimizing it saves")
+    analyze.add_argument('--sets', action='store_true', help="print the nullable nonterminals and FIRST/FOLLOW sets")
+    analyze.set_defaults(handler=analyze_command)
+
+    options = argument_parser.parse_args(arguments)
+    if options.profile is None:
+        return options.handler(options, None)
+    from Profiler import Profiler
+
+    profiler = Profiler()
+    try:
+        return options.handler(options, profiler)
+    finally:
+        profiler.stop()
+        profiler.write(options.profile)
 
 
 if __name__ == '__main__':
-    # simple_test()
-    complex_test()
+    sys.exit(main())
@@ -0,0 +1,59 @@
+import importlib.util
+import os
+import random
+import unittest
+
+from Lexer import load_lexer
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Tokens, near misses, literals, comments, errors and whitespace, joined at random
+PIECES = ['a', 'b1', '_x', '12', '-3', '0', '007', '-', '--4', 'int', 'if', 'iff', 'read', '"s t r"', '"',
+          '"unterminated', '//', '// c "q" //', '/', '/ /', '==', '=', '!=', '!', '&&', '&', '||', '|', '<=', '<',
+          '>=', '(', ')', '[', ']', '{', '}', ';', ':', ',', '%', '*', '+', ' ', '  ', '\t', '\n', '\r\n', '@', '#$',
+          'é', 'ñame', '€', '"é"', '12ab', 'a-1', 'x"y"z', '///', '"//"', '\f', '\v', 'a' * 60, '1' * 50,
+          'programx', '&&&', '|||', '<==', '!==']
+
+
+@unittest.skipUnless(importlib.util.find_spec('numpy'), "the bulk lexer needs NumPy")
+class BulkLexerTest(unittest.TestCase):
+    # Random texts against the Lexer: the same tokens, and unless final a cut that does not change them
+    @classmethod
+    def setUpClass(cls):
+        from BulkLexer import BulkLexer
+
+        cls.lexer = load_lexer(os.path.join(HERE, "token.in"))
+        cls.bulk = BulkLexer(cls.lexer)
+
+    def random_text(self, rng, count):
+        return ''.join(rng.choice(PIECES) for _ in range(rng.randint(0, count)))
+
+    def test_final(self):
+        rng = random.Random(0)
+        for _ in range(2000):
+            text = self.random_text(rng, 25)
+            position = rng.randint(0, len(text))
+            self.assertEqual(self.bulk.scan_chunk(text, position), self.lexer.scan_chunk(text, position), text)
+
+    def test_not_final(self):
+        # Whatever comes after the chunk, its tokens and those scanned from where it stopped are the
+        # tokens of the whole text
+        rng = random.Random(1)
+        for _ in range(2000):
+            text = self.random_text(rng, 25)
+            full = text + self.random_text(rng, 5)
+            position = rng.randint(0, len(text))
+            tokens, consumed = self.bulk.scan_chunk(text, position, final=False)
+            self.assertGreaterEqual(consumed, position)
+            rest, end = self.bulk.scan_chunk(full, consumed)
+            self.assertEqual((tokens + rest, end), self.lexer.scan_chunk(full, position), (text, full))
+
+    def test_long_text(self):
+        # Many lines, so the literals, comments and segments are found across the whole chunk at once
+        rng = random.Random(2)
+        text = self.random_text(rng, 3000)
+        self.assertEqual(self.bulk.scan_chunk(text), self.lexer.scan_chunk(text))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+import itertools
+import os
+import random
+import unittest
+from contextlib import redirect_stdout
+from functools import lru_cache
+from io import StringIO
+
+from Benchmark import generate_terminals, minimum_lengths
+from GLRParser import GLRParser, count_trees, first_tree
+from Grammar import FormalGrammar
+from Parser import LR0Parser
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Grammars with conflicts: (productions, start, terminals)
+AMBIGUOUS = {
+    'expression': ({'E': [['E', '+', 'E'], ['E', '*', 'E'], ['(', 'E', ')'], ['a']]}, 'E', ['+', '*', '(', ')', 'a']),
+    'empty': ({'S': [['A', 'S', 'b'], ['a'], []], 'A': [['a'], []]}, 'S', ['a', 'b']),
+    'hidden': ({'S': [['A', 'S', 'a'], ['b']], 'A': [[]]}, 'S', ['a', 'b']),
+    'palindrome': ({'S': [['a', 'S', 'a'], ['b', 'S', 'b'], ['a'], ['b'], []]}, 'S', ['a', 'b']),
+    'long': ({'S': [['A', 'A', 'A', 'A'], ['a', 'S']], 'A': [['a'], ['a', 'a'], []]}, 'S', ['a']),
+}
+# S -> S S with an empty S: infinitely many trees for every string
+CYCLIC = ({'S': [['S', 'S'], ['a'], []]}, 'S', ['a'])
+
+
+def build(productions, start, terminals, method):
+    with redirect_stdout(StringIO()):  # The conflicts are expected
+        return LR0Parser(productions, start, terminals, method=method)
+
+
+def brute_count(productions, start, tokens):
+    # Parse trees of tokens, by trying every split (for grammars without cycles)
+    lengths = minimum_lengths(productions)
+
+    @lru_cache(maxsize=None)
+    def count(symbol, i, j):
+        if symbol not in productions:
+            return 1 if j == i + 1 and tokens[i] == symbol else 0
+        return sum(sequence(tuple(rhs), i, j) for rhs in productions[symbol])
+
+    @lru_cache(maxsize=None)
+    def sequence(rhs, i, j):
+        if not rhs:
+            return 1 if i == j else 0
+        rest = sum(lengths.get(symbol, 1) for symbol in rhs[1:])  # What is left for rhs[0] to derive
+        return sum(count(rhs[0], i, k) * sequence(rhs[1:], k, j) for k in range(i, j - rest + 1)
+                   if count(rhs[0], i, k))
+
+    return count(start, 0, len(tokens))
+
+
+class GLRTest(unittest.TestCase):
+    def test_forest_counts(self):
+        # As many trees in the forest as there are derivations, and the first of them is one
+        rng = random.Random(0)
+        for name, (productions, start, terminals) in AMBIGUOUS.items():
+            for method in ('lr0', 'lalr'):
+                glr_parser = GLRParser(build(productions, start, terminals, method))
+                strings = [string for length in range(5) for string in itertools.product(terminals, repeat=length)]
+                strings += [[rng.choice(terminals) for _ in range(rng.randint(5, 9))] for _ in range(40)]
+                for string in strings:
+                    tokens = [(token, None) for token in string]
+                    expected = brute_count(productions, start, tuple(string))
+                    root = glr_parser.parse_tokens(tokens)
+                    self.assertEqual(count_trees(root) if root else 0, expected, (name, method, string))
+                    self.assertEqual(glr_parser.recognize(tokens), bool(expected), (name, method, string))
+                    if root:
+                        self.assertEqual(self.leaves(first_tree(root)), list(string))
+
+    def test_cyclic_grammar(self):
+        glr_parser = GLRParser(build(*CYCLIC, 'lalr'))
+        for length in range(4):
+            root = glr_parser.parse_tokens([('a', None)] * length)
+            self.assertEqual(count_trees(root), float('inf'))
+            self.assertEqual(self.leaves(first_tree(root)), ['a'] * length)
+
+    def test_deterministic_grammars(self):
+        # Without conflicts the forest holds exactly the tree the LR parser builds
+        for file_name in ('grammar.in', 'grammar_g4g.in'):
+            grammar = FormalGrammar(os.path.join(HERE, file_name))
+            parser = build(grammar.productions, grammar.start, grammar.terminals, 'lalr')
+            glr_parser = GLRParser(parser)
+            rng = random.Random(0)
+            for trial in range(60):
+                string = generate_terminals(grammar.productions, grammar.start, rng.randint(1, 80), trial)
+                if trial % 2:  # Most of these no longer parse
+                    string.insert(rng.randrange(len(string) + 1), rng.choice(grammar.terminals))
+                tokens = [(token, None) for token in string]
+                accepted, tree = parser.parse_with_actions(tokens, lambda lhs, rhs, values: (lhs, tuple(values)))
+                root = glr_parser.parse_tokens(tokens)
+                self.assertEqual(bool(root), accepted, (file_name, string))
+                self.assertEqual(glr_parser.recognize(tokens), accepted, (file_name, string))
+                if accepted:
+                    self.assertEqual(first_tree(root), tree)
+                    self.assertEqual(count_trees(root), 1)
+
+    @staticmethod
+    def leaves(tree):
+        symbol, rest = tree
+        if not isinstance(rest, tuple):
+            return [symbol]
+        return [leaf for child in rest for leaf in GLRTest.leaves(child)]
+
+
+if __name__ == '__main__':
+    unittest.main()
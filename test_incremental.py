@@ -0,0 +1,67 @@
+import os
+import random
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+
+from Grammar import FormalGrammar
+from Incremental import IncrementalCompiler
+from Lexer import load_lexer
+from Parser import LR0Parser
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+STATEMENTS = ['a : int ;', 'read b ;', 'print a + c ;', 'x = y * z ;', 'if ( a < b ) { print a ; }',
+              'while ( x ) { read x ; ; print w ; }', 'q : string ;', 'read zz ;']
+# The scanner reports integers as constants, which grammar.in does not take
+BROKEN = ['', 'read ;', 'a : int', '}', 'q : string [ 3 ] ;']
+
+
+class IncrementalTest(unittest.TestCase):
+    # Random edits against compiling the edited text from scratch: same tokens, outcome and tree
+    @classmethod
+    def setUpClass(cls):
+        grammar = FormalGrammar(os.path.join(HERE, "grammar.in"))
+        with redirect_stdout(StringIO()):
+            cls.parser = LR0Parser(grammar.productions, grammar.start, grammar.terminals, method='lalr')
+        cls.lexer = load_lexer(os.path.join(HERE, "token.in"))
+
+    def check(self, compiler):
+        reference = IncrementalCompiler(self.parser, self.lexer, compiler.text)
+        self.assertEqual((compiler.accepted, compiler.error, compiler.types, compiler.values),
+                         (reference.accepted, reference.error, reference.types, reference.values), compiler.text)
+        self.assertEqual(compiler.tree(), reference.tree(), compiler.text)
+
+    def test_random_edits(self):
+        rng = random.Random(0)
+        for _ in range(60):
+            parts = [rng.choice(STATEMENTS) for _ in range(rng.randint(1, 8))]
+            compiler = IncrementalCompiler(self.parser, self.lexer, ' ; '.join(parts))
+            for _ in range(8):
+                text = compiler.text
+                choice = rng.random()
+                if choice < 0.5:  # Replace a statement, sometimes with a broken one
+                    i = rng.randrange(len(parts))
+                    start = sum(len(part) + 3 for part in parts[:i])
+                    new = rng.choice(STATEMENTS) if rng.random() < 0.8 else rng.choice(BROKEN)
+                    compiler.edit(start, start + len(parts[i]), new)
+                    parts[i] = new
+                elif choice < 0.7:  # Insert a statement
+                    i = rng.randrange(len(parts))
+                    start = sum(len(part) + 3 for part in parts[:i])
+                    new = rng.choice(STATEMENTS)
+                    compiler.edit(start, start, new + ' ; ')
+                    parts.insert(i, new)
+                else:  # Change a few characters anywhere, check, then change them back
+                    start = rng.randint(0, len(text))
+                    end = min(len(text), start + rng.randint(0, 4))
+                    new = rng.choice(['', 'a', ' ', ';', '1', '+', '"'])
+                    compiler.edit(start, end, new)
+                    self.check(compiler)
+                    compiler.edit(start, start + len(new), text[start:end])
+                    self.assertEqual(compiler.text, text)
+                self.check(compiler)
+
+
+if __name__ == '__main__':
+    unittest.main()